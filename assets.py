@@ -0,0 +1,129 @@
+import os
+import struct
+import pygame
+
+# Shared image loader for all the games. Nothing is decoded at import time:
+#   size(name)  width and height read from the PNG header, without decoding the image
+#   image(name) the decoded image; once a display exists every image is converted to the display format and
+#               packed into one atlas surface, and image() returns subsurface views into it
+# Collision masks are not kept here, collision.get_mask builds them from the images once per surface.
+# Headless runs without a display only ever decode the images they really use (the birds and pipes they check
+# collisions with) and never pay for the background, ground, start and game over images.
+# Code that draws onto offscreen surfaces without a display calls prepare_offscreen() first.
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+FILES = {
+    'bird_down': 'bird_down.png',
+    'bird_mid': 'bird_mid.png',
+    'bird_up': 'bird_up.png',
+    'background': 'background.png',
+    'ground': 'ground.png',
+    'pipe_top': 'pipe_top.png',
+    'pipe_bottom': 'pipe_bottom.png',
+    'game_over': 'game_over.png',
+    'start': 'start.png',
+}
+BIRD_FRAMES = ('bird_down', 'bird_mid', 'bird_up')
+ATLAS_WIDTH = 1024
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_sizes = {}
+_decoded = {}  # images loaded before there was a display, as they are in the file
+_atlas = None
+_atlas_images = {}  # subsurfaces of the atlas by name
+_offscreen = False
+
+
+def path(name):
+    return os.path.join(ASSET_DIR, FILES[name])
+
+
+def size(name):
+    image_size = _sizes.get(name)
+    if image_size is None:
+        with open(path(name), 'rb') as f:
+            header = f.read(24)
+        if header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+            raise ValueError("{0} is not a PNG image".format(path(name)))
+        image_size = _sizes[name] = struct.unpack('>II', header[16:24])
+    return image_size
+
+
+def decode(name):
+    surface = _decoded.get(name)
+    if surface is None:
+        surface = _decoded[name] = pygame.image.load(path(name))
+    return surface
+
+
+# shelf packing: the images are placed in rows from the tallest to the smallest, a new row starts when
+# the current one is full
+def pack(names, width=ATLAS_WIDTH):
+    positions = {}
+    x = y = row_height = 0
+    for name in sorted(names, key=lambda name: -size(name)[1]):
+        w, h = size(name)
+        if x + w > width and x > 0:
+            x, y = 0, y + row_height
+            row_height = 0
+        positions[name] = (x, y)
+        x += w
+        row_height = max(row_height, h)
+    return positions, (max(width, max(size(name)[0] for name in names)), y + row_height)
+
+
+def build_atlas():
+    global _atlas
+    positions, atlas_size = pack(FILES)
+    _atlas = pygame.Surface(atlas_size, pygame.SRCALPHA).convert_alpha()
+    _atlas.fill((0, 0, 0, 0))
+    for name, position in positions.items():
+        converted = decode(name).convert_alpha()  # colour keys become transparent pixels
+        _atlas.blit(converted, position, special_flags=pygame.BLEND_RGBA_MAX)  # a plain copy onto the empty atlas
+        _atlas_images[name] = _atlas.subsurface(pygame.Rect(position, size(name)))
+
+
+# Without a display image() hands out the images as they are in the files, and the ones with an alpha channel
+# (background, ground, start, game over) blit many times slower onto a plain surface than in pygame's own 32 bit
+# layout. Converting them only needs the display module, not a window, so this works headless and with the SDL
+# dummy driver; the colour keyed images (birds, pipes) are already fast and stay as they are
+def prepare_offscreen():
+    global _offscreen
+    if _offscreen:
+        return
+    pygame.display.init()
+    reference = pygame.Surface((1, 1), pygame.SRCALPHA, 32)
+    for name in FILES:
+        surface = decode(name)
+        if surface.get_flags() & pygame.SRCALPHA:
+            _decoded[name] = surface.convert(reference)
+    _offscreen = True
+
+
+def image(name):
+    if _atlas is None:
+        if pygame.display.get_surface() is None:
+            return decode(name)
+        build_atlas()
+    return _atlas_images[name]
+
+
+# class attribute that reads as the image of an asset, e.g. IMG = AssetImage('ground'), so the image is only
+# looked up (and loaded) when it is used
+class AssetImage:
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return image(self.name)
+
+
+# read only list of asset images, e.g. the animation frames of the bird
+class AssetImages:
+    def __init__(self, names):
+        self.names = tuple(names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return image(self.names[index])
@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import numpy as np
+
+# headless benchmarks of the training and play loops. Every benchmark runs with fixed seeds and reports
+# frames/sec, bird frames/sec (frames times the birds alive in them), generations (or episodes) per minute
+# and how the time splits over the phases of a frame. Results are written as JSON so runs of different
+# commits or machines can be compared with each other.
+#
+# The phases are timed by wrapping the functions of the loops for the duration of a benchmark, so the loops
+# themselves stay untouched; the wrappers cost about a microsecond per call, which is counted in the phase.
+
+CONFIG_PATH = "config-feedforward.txt"
+
+
+# Replaces functions and methods of the game modules by timed versions and puts the originals back afterwards.
+# frames and birds are added to the frame and bird frame counters on every call, either as numbers or as
+# functions of the call arguments
+class PhaseTimer:
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.frames = 0
+        self.bird_frames = 0
+        self.patches = []
+
+    def wrap(self, owner, name, phase, frames=0, birds=0):
+        original = getattr(owner, name)
+        self.seconds.setdefault(phase, 0.0)
+        self.calls.setdefault(phase, 0)
+
+        def timed(*args, **kwargs):
+            if frames:
+                self.frames += frames(*args, **kwargs) if callable(frames) else frames
+            if birds:
+                self.bird_frames += birds(*args, **kwargs) if callable(birds) else birds
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds[phase] += time.perf_counter() - start
+                self.calls[phase] += 1
+
+        setattr(owner, name, timed)
+        self.patches.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self.patches):
+            setattr(owner, name, original)
+        self.patches = []
+
+    def report(self, seconds, generations=None):
+        phases = {phase: {'seconds': self.seconds[phase], 'share': self.seconds[phase] / seconds,
+                          'calls': self.calls[phase]} for phase in self.seconds}
+        other = seconds - sum(self.seconds.values())
+        phases['other'] = {'seconds': other, 'share': other / seconds, 'calls': None}
+        result = {
+            'seconds': seconds,
+            'frames': self.frames,
+            'bird_frames': self.bird_frames,
+            'frames_per_second': self.frames / seconds,
+            'bird_frames_per_second': self.bird_frames / seconds,
+            'phases': phases,
+        }
+        if generations is not None:
+            result['generations'] = generations
+            result['generations_per_minute'] = generations / seconds * 60
+        return result
+
+
+def neat_population(pop_size, seed):
+    import neat
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                neat.DefaultSpeciesSet, neat.DefaultStagnation, CONFIG_PATH)
+    config.pop_size = pop_size
+    random.seed(seed)  # neat draws the initial genomes and all mutations from the random module
+    return neat.Population(config)
+
+
+# NEAT training with bird_ai.main as the fitness function
+def bench_bird_ai(args, pop_size):
+    from functools import partial
+    import bird_ai
+    from population_network import PopulationNetwork
+
+    population = neat_population(pop_size, args.seed)
+    bird_ai.GEN = 0
+    timer = PhaseTimer()
+    timer.wrap(bird_ai.BirdPopulation, 'move', 'physics', frames=1,
+               birds=lambda birds: int(np.count_nonzero(birds.alive)))
+    timer.wrap(PopulationNetwork, 'activate', 'inference')
+    timer.wrap(bird_ai.Pipe, 'collide_population', 'collision')
+    try:
+        start = time.perf_counter()
+        population.run(partial(bird_ai.main, headless=True, course_seed=args.seed, max_frames=args.max_frames),
+                       args.generations)
+        seconds = time.perf_counter() - start
+    finally:
+        timer.restore()
+    return timer.report(seconds, args.generations)
+
+
+# NEAT training with flappy_ai.eval_genomes as the fitness function
+def bench_flappy_ai(args, pop_size):
+    from functools import partial
+    import flappy_ai
+    from population_network import PopulationNetwork
+
+    population = neat_population(pop_size, args.seed)
+    flappy_ai.generation = 0
+    timer = PhaseTimer()
+    timer.wrap(flappy_ai, 'step_world', 'world')
+    timer.wrap(flappy_ai, 'count_passed_pipes', 'scoring', frames=1)
+    timer.wrap(PopulationNetwork, 'activate', 'inference')
+    timer.wrap(flappy_ai, 'step_bird', 'physics_and_collision', birds=1)
+    try:
+        start = time.perf_counter()
+        population.run(partial(flappy_ai.eval_genomes, headless=True, course_seed=args.seed,
+                               max_frames=args.max_frames), args.generations)
+        seconds = time.perf_counter() - start
+    finally:
+        timer.restore()
+    return timer.report(seconds, args.generations)
+
+
+# the DQN training loop of main.py, one episode counts as a generation
+def bench_dqn(args, pop_size=None):
+    import pygame
+    import main as dqn
+    from dqn_learner import Learner
+
+    np.random.seed(args.seed)  # epsilon greedy exploration
+    dqn.course_seed = args.seed
+    timer = PhaseTimer()
+    timer.wrap(dqn, 'choose_action', 'inference')
+    timer.wrap(Learner, 'push', 'learning')  # with the learner thread only the time the game waits for it
+    timer.wrap(dqn.Bird, 'update', 'physics', frames=1, birds=1)
+    timer.wrap(pygame.sprite, 'spritecollide', 'collision')
+    try:
+        start = time.perf_counter()
+        dqn.main(headless=True, max_episodes=args.episodes, max_steps=args.max_steps, threaded=not args.dqn_sync)
+        seconds = time.perf_counter() - start
+    finally:
+        timer.restore()
+    return timer.report(seconds, args.episodes)
+
+
+# a bird.py game flown by a simple autopilot, drawing included
+def bench_bird(args, pop_size=None):
+    import bird
+
+    def autopilot(player, pipe):  # jump once the bird has fallen to the lower part of the gap
+        return player.y + player.img.get_height() > pipe.bottom - 40 and player.frame_count > 6
+
+    timer = PhaseTimer()
+    timer.wrap(bird.Bird, 'move', 'physics', frames=1, birds=1)
+    timer.wrap(bird.Pipe, 'collide', 'collision')
+    timer.wrap(bird, 'draw_window', 'drawing')
+    try:
+        start = time.perf_counter()
+        bird.main(policy=autopilot, fps=None, max_frames=args.max_frames, seed=args.seed)
+        seconds = time.perf_counter() - start
+    finally:
+        timer.restore()
+    return timer.report(seconds)
+
+
+# a flappy.py game flown by a simple autopilot, drawing included
+def bench_flappy(args, pop_size=None):
+    import pygame
+    import flappy
+
+    def autopilot(player, pipes):  # flap once the bird has sunk below the middle of the next gap
+        ahead = [pipe for pipe in pipes if pipe.rect.right > player.rect.left]
+        gap_middle = 350
+        if len(ahead) >= 2:  # pipes are spawned as top, bottom pairs
+            gap_middle = (ahead[0].rect.bottom + ahead[1].rect.top) / 2
+        return player.rect.centery > gap_middle + 10 and player.vel >= 0
+
+    timer = PhaseTimer()
+    timer.wrap(flappy.Bird, 'update', 'physics', frames=1, birds=1)
+    timer.wrap(pygame.sprite, 'spritecollide', 'collision')
+    timer.wrap(pygame.sprite.AbstractGroup, 'draw', 'drawing')
+    timer.wrap(pygame.display, 'update', 'display')
+    try:
+        start = time.perf_counter()
+        flappy.main(policy=autopilot, fps=None, max_frames=args.max_frames, seed=args.seed)
+        seconds = time.perf_counter() - start
+    finally:
+        timer.restore()
+    return timer.report(seconds)
+
+
+# the flappy.py game batched in vec_env.FlappyVecEnv, one game per member of --pop-size, flown by random flaps
+def bench_flappy_vec(args, pop_size):
+    from vec_env import FlappyVecEnv
+
+    env = FlappyVecEnv(pop_size, seed=args.seed)
+    env.reset()
+    actions = np.random.default_rng(args.seed).random((args.max_frames, pop_size)) < 0.07  # about one flap in 14
+    timer = PhaseTimer()
+    timer.wrap(FlappyVecEnv, 'step', 'step', frames=1, birds=pop_size)  # observations included
+    try:
+        start = time.perf_counter()
+        for frame_actions in actions:
+            env.step(frame_actions)
+        seconds = time.perf_counter() - start
+    finally:
+        timer.restore()
+    return timer.report(seconds)
+
+
+# benchmarks which run a NEAT population are repeated for every --pop-size
+BENCHMARKS = {
+    'bird_ai': (bench_bird_ai, True),
+    'flappy_ai': (bench_flappy_ai, True),
+    'dqn': (bench_dqn, False),
+    'bird': (bench_bird, False),
+    'flappy': (bench_flappy, False),
+    'flappy_vec': (bench_flappy_vec, True),
+}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name, result):
+    line = "{0:<20} {1:>9.0f} frames/s {2:>11.0f} bird frames/s".format(
+        name, result['frames_per_second'], result['bird_frames_per_second'])
+    if 'generations_per_minute' in result:
+        line += " {0:>8.1f} generations/min".format(result['generations_per_minute'])
+    print(line)
+    for phase, timing in sorted(result['phases'].items(), key=lambda item: -item[1]['seconds']):
+        print("    {0:<22} {1:>8.3f}s {2:>6.1%}".format(phase, timing['seconds'], timing['share']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark the training and play loops headless')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark',
+                        help='benchmarks to run out of {0}, all of them by default'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--seed', type=int, default=1, help='seed of the genomes, courses and exploration')
+    parser.add_argument('--pop-size', type=int, nargs='+', default=[50],
+                        help='population sizes to run the NEAT benchmarks with, games of the flappy_vec one')
+    parser.add_argument('--generations', type=int, default=3, help='generations per NEAT benchmark')
+    parser.add_argument('--max-frames', type=int, default=2000,
+                        help='frame cap of a NEAT generation and length of the play benchmarks')
+    parser.add_argument('--episodes', type=int, default=2, help='episodes of the DQN benchmark')
+    parser.add_argument('--max-steps', type=int, default=200, help='steps per DQN episode')
+    parser.add_argument('--dqn-sync', action='store_true',
+                        help='train the DQN in the game loop instead of on its learner thread, for repeatable runs')
+    parser.add_argument('--output', '-o', default='benchmark.json', help='JSON file the results are written to')
+    parser.add_argument('--window', action='store_true', help='use the real video driver instead of a dummy one')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark {0}".format(name))
+
+    if not args.window:
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # must be set before pygame opens a display
+        os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+    results = {}
+    for name in args.benchmarks or list(BENCHMARKS):
+        bench, per_pop_size = BENCHMARKS[name]
+        for pop_size in (args.pop_size if per_pop_size else [None]):
+            key = name if pop_size is None else "{0}/pop{1}".format(name, pop_size)
+            results[key] = bench(args, pop_size)
+            print_result(key, results[key])
+
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {'seed': args.seed, 'generations': args.generations, 'max_frames': args.max_frames,
+                     'episodes': args.episodes, 'max_steps': args.max_steps, 'dqn_sync': args.dqn_sync},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("results written to", args.output)
+
+
+if __name__ == '__main__':
+    main()
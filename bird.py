@@ -1,7 +1,15 @@
 import pygame
-import time
 import os
 import random
+import argparse
+import importlib.util
+import assets
+import collision
+import hud
+from sprite_cache import blit_rotated
+from renderer import DirtyRenderer
+from game_loop import GameLoop, wait_for_key
+from course import Course
 
 pygame.font.init()  # some initialization to use font in pygame
 
@@ -12,16 +20,9 @@ GEN = 0  # declaring generation variable
 
 pygame.display.set_caption("Flappy Bird")
 
-# importing the images of birds, pipes, background and base
-bird_images = [pygame.image.load("assets/bird_down.png"),
-               pygame.image.load("assets/bird_mid.png"),
-               pygame.image.load("assets/bird_up.png")]
-skyline_image = pygame.image.load("assets/background.png")
-ground_image = pygame.image.load("assets/ground.png")
-top_pipe_image = pygame.image.load("assets/pipe_top.png")
-bottom_pipe_image = pygame.image.load("assets/pipe_bottom.png")
-game_over_image = pygame.image.load("assets/game_over.png")
-start_image = pygame.image.load("assets/start.png")
+# the images of birds, pipes, background and base come from the shared asset loader,
+# which only loads an image the first time it is used
+bird_images = assets.AssetImages(assets.BIRD_FRAMES)
 
 # declaring font
 STAT_FONT = pygame.font.SysFont('impact', 50)
@@ -93,30 +94,30 @@ class Bird:
             self.img = self.IMGS[1]
             self.img_number = self.ANIMATION_TIME * 2  # reset the image number so that next image should be IMG[2]
 
-        rotated_image = pygame.transform.rotate(self.img, self.tilt)  # just rotating the image around its center
-        new_rect = rotated_image.get_rect(center=self.img.get_rect(topleft=(self.x, self.y)).center)
-        win.blit(rotated_image, new_rect)
+        # just rotating the image around its center, every (image, tilt) pair is only rotated once
+        blit_rotated(win, self.img, self.tilt, (self.x, self.y))
 
     def get_mask(self):  # getting the mask of the bird means the contour of bird to check its collision with any pipe
-        return pygame.mask.from_surface(self.img)
+        return collision.get_mask(self.img)
 
 
 class Pipe:
     GAP = 200
     VEL = 5
+    TOP_PIPE = assets.AssetImage('pipe_top')
+    BOTTOM_PIPE = assets.AssetImage('pipe_bottom')
 
-    def __init__(self, x):
+    def __init__(self, x, rng=random):
         self.x = x
+        self.rng = rng  # pass a seeded Course to get the same pipes every time
         self.height = 0  # for random purpose
         self.top = 0  # y coordinates of top pipe
         self.bottom = 0  # y coordinates of bottom pipe
-        self.TOP_PIPE = top_pipe_image
-        self.BOTTOM_PIPE = bottom_pipe_image
         self.passed = False
         self.set_height()
 
     def set_height(self):  # randomly setting the heights of both pipes
-        self.height = random.randrange(50, 450)
+        self.height = self.rng.randrange(50, 450)
         self.bottom = self.height + self.GAP
         self.top = self.height - self.TOP_PIPE.get_height()
 
@@ -128,26 +129,17 @@ class Pipe:
         win.blit(self.BOTTOM_PIPE, (self.x, self.bottom))
 
     def collide(self, bird):  # for checking collision of the bird with the pipes
-        bird_mask = bird.get_mask()
-        top_pipe_mask = pygame.mask.from_surface(self.TOP_PIPE)
-        bottom_pipe_mask = pygame.mask.from_surface(self.BOTTOM_PIPE)
-
-        top_offset = (self.x - bird.x, self.top - round(bird.y))
-        bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
-
-        top_overlap = bird_mask.overlap(top_pipe_mask, top_offset)
-        bottom_overlap = bird_mask.overlap(bottom_pipe_mask, bottom_offset)
-
-        if top_overlap or bottom_overlap:
-            return True
-        return False
+        bird_pos = (bird.x, round(bird.y))
+        # collision.collide only compares the cached masks when the bounding boxes actually intersect
+        return (collision.collide(bird.img, bird_pos, self.TOP_PIPE, (self.x, self.top)) or
+                collision.collide(bird.img, bird_pos, self.BOTTOM_PIPE, (self.x, self.bottom)))
 
 
 # BASE Class for showing base
 class Base:
     VEL = 5
-    IMG = ground_image
-    WIDTH = ground_image.get_width()
+    IMG = assets.AssetImage('ground')
+    WIDTH = assets.size('ground')[0]
 
     def __init__(self, y):  # base will be shown moving by taking two images of the same base and putting it one after other
         self.y = y
@@ -168,95 +160,129 @@ class Base:
         win.blit(self.IMG, (self.x2, self.y))
 
 
-# Our main drawing function
-def draw_window(win, bird, pipes, base, score):
-    global DRAW_LINES
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            quit()
-
-    win.blit(skyline_image, (0, 0))
+# Our main drawing function, it draws through a DirtyRenderer so only the parts of the window that changed are redrawn.
+# The events are pumped by the game loop
+def draw_window(renderer, bird, pipes, base, score):
+    renderer.begin_frame()
     for pipe in pipes:
-        pipe.draw(win)
-    base.draw(win)
+        pipe.draw(renderer)
+    base.draw(renderer)
 
-    bird.draw(win)
+    bird.draw(renderer)
 
-    text = STAT_FONT.render('Score : ' + str(score), 1, (255, 255, 255))
-    win.blit(text, (WIN_WIDTH - 10 - text.get_width(), 50))
+    text = hud.render(STAT_FONT, 'Score : ' + str(score), 1, (255, 255, 255))
+    renderer.blit(text, (WIN_WIDTH - 10 - text.get_width(), 50))
 
     alive_text = 'Alive : 1'
-    alive_text_rendered = STAT_FONT.render(alive_text, 1, (255, 255, 255))
-    win.blit(alive_text_rendered, (10, 50))
+    alive_text_rendered = hud.render(STAT_FONT, alive_text, 1, (255, 255, 255))
+    renderer.blit(alive_text_rendered, (10, 50))
 
-    pygame.display.update()
+    renderer.end_frame()
 
 
-def main():
+# policy(bird, pipe) decides every frame whether the bird jumps instead of the keyboard, and a crash then ends
+# the game instead of restarting it; fps=None runs the loop uncapped, max_frames stops it after that many frames
+# and seed fixes the pipes. After a crash the game over screen waits two seconds, or until a key is pressed,
+# and a new round starts
+def main(policy=None, fps=30, max_frames=None, seed=None):
     global GEN, game_started
 
     pygame.init()
     win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
     pygame.display.set_caption("Flappy Bird")
-
-    bird = Bird(230, 350)
-    pipes = [Pipe(500)]  # list of pipe objects
-    base_object = Base(630)
-    clock = pygame.time.Clock()
-    run = True
-    score = 0
-    bird_jump = False
-
-    while run:
-        clock.tick(30)  # fps
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:  # if the user click on the red cross button then quit the game
-                run = False
-                pygame.quit()
-                quit()
-
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_SPACE and not bird_jump:
-                    bird.jump()
-                    bird_jump = True
-
-            if event.type == pygame.KEYUP:
-                if event.key == pygame.K_SPACE:
-                    bird_jump = False
-
-        pipe_ind = 0
-
-        # this part is done to check in the case when 2 pipes appear on the screen that which is the pipe we are evaluating on
-        if len(pipes) > 1 and bird.x > pipes[0].x + pipes[0].TOP_PIPE.get_width():
-            pipe_ind = 1
-
-        bird.move()
-        for pipe in pipes:
-            # checking if the bird has hit the ground or if the pipe and bird collide
-            if pipe.collide(bird) or bird.y + bird.img.get_height() >= 630 or bird.y < 0:
-                game_over_text = STAT_FONT.render('Game Over', 1, (255, 255, 255))
-                win.blit(game_over_text, (WIN_WIDTH // 2 - game_over_text.get_width() // 2,
-                                          WIN_HEIGHT // 2 - game_over_text.get_height() // 2))
-                pygame.display.update()
-                time.sleep(2)
-                main()
-
-            if not pipe.passed and bird.x > pipe.x:  # if the passed is not set to true and bird has passed the pipe then set it to true
-                pipe.passed = True
-                score += 1
-                pipes.append(Pipe(500))  # add another pipe
-
-            if pipe.x + pipe.TOP_PIPE.get_width() < 0:  # if pipe passed the screen add it to remove list
-                pipes.remove(pipe)
-
-            pipe.move()
-
-        base_object.move()
-        draw_window(win, bird, pipes, base_object, score)
-
-    pygame.quit()
+    renderer = DirtyRenderer(win, assets.image('background'))
+    loop = GameLoop(fps)
+    frame = 0
+
+    while True:
+        bird = Bird(230, 350)
+        course = Course(seed)
+        pipes = [Pipe(500, course)]  # list of pipe objects
+        base_object = Base(630)
+        score = 0
+        bird_jump = False
+        crashed = False
+        renderer.invalidate()
+        loop.reset()
+
+        while not crashed:
+            for event in loop.tick():  # waits for the next step and pumps the events once
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE and not bird_jump:
+                        bird.jump()
+                        bird_jump = True
+
+                if event.type == pygame.KEYUP:
+                    if event.key == pygame.K_SPACE:
+                        bird_jump = False
+
+            pipe_ind = 0
+
+            # this part is done to check in the case when 2 pipes appear on the screen that which is the pipe we are evaluating on
+            if len(pipes) > 1 and bird.x > pipes[0].x + pipes[0].TOP_PIPE.get_width():
+                pipe_ind = 1
+
+            if policy is not None and policy(bird, pipes[pipe_ind]):
+                bird.jump()
+
+            bird.move()
+            for pipe in pipes:
+                # checking if the bird has hit the ground or if the pipe and bird collide
+                if pipe.collide(bird) or bird.y + bird.img.get_height() >= 630 or bird.y < 0:
+                    crashed = True
+                    break
+
+                if not pipe.passed and bird.x > pipe.x:  # if the passed is not set to true and bird has passed the pipe then set it to true
+                    pipe.passed = True
+                    score += 1
+                    pipes.append(Pipe(500, course))  # add another pipe
+
+                if pipe.x + pipe.TOP_PIPE.get_width() < 0:  # if pipe passed the screen add it to remove list
+                    pipes.remove(pipe)
+
+                pipe.move()
+            if crashed:
+                break
+
+            base_object.move()
+            if loop.render:
+                draw_window(renderer, bird, pipes, base_object, score)
+
+            frame += 1
+            if max_frames is not None and frame >= max_frames:
+                return
+
+        game_over_text = hud.render(STAT_FONT, 'Game Over', 1, (255, 255, 255))
+        win.blit(game_over_text, (WIN_WIDTH // 2 - game_over_text.get_width() // 2,
+                                  WIN_HEIGHT // 2 - game_over_text.get_height() // 2))
+        pygame.display.update()
+        if policy is not None:
+            return
+        wait_for_key(timeout=2)  # blocks instead of spinning until the next round starts
+
+
+# the policy of main() that flies the bird with a network exported by export_policy.py from a bird_ai.py winner.
+# The network sees what it saw in training, the height of the bird and its distance to the top and the bottom of
+# the next pipe, and the bird jumps when its output is above 0.5. The policy module only needs the math module,
+# so playing never imports neat
+def autopilot(path):
+    spec = importlib.util.spec_from_file_location('autopilot_policy', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if module.NUM_INPUTS != 3:
+        raise ValueError("{0} takes {1} inputs, the autopilot gives it 3".format(path, module.NUM_INPUTS))
+    activate = module.activate
+
+    def policy(bird, pipe):
+        return activate((bird.y, abs(bird.y - pipe.height), abs(bird.y - pipe.bottom)))[0] > 0.5
+    return policy
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--autopilot', metavar='POLICY',
+                        help='let a policy exported by export_policy.py fly the bird instead of the keyboard')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the pipe course')
+    args = parser.parse_args()
+
+    main(autopilot(args.autopilot) if args.autopilot else None, seed=args.seed)
@@ -1,8 +1,30 @@
 import pygame
 import time
+import queue
+import threading
 import neat
+import numpy as np
 import os
 import random
+import argparse
+import assets
+import collision
+import hud
+from sprite_cache import blit_rotated
+from renderer import DirtyRenderer
+from game_loop import GameLoop
+from turbo import TurboControl, SPEEDS
+from functools import partial
+from course import Course, generation_seed
+from parallel_eval import ParallelEvaluator
+from population_network import PopulationNetwork
+from trajectory import TrajectoryRecorder, read_generation, split_frames
+from profiling import FrameProfiler, ProfileReporter
+from video import VideoWriter, capture
+from checkpoint import NeatCheckpointer, restore_population, load_genome, seed_population
+from export_policy import export as export_policy
+from fitness_cache import FitnessCache, CACHE_SIZE
+from neat.reporting import BaseReporter
 
 pygame.font.init()  # some initialization to use font in pygame
 
@@ -10,20 +32,19 @@ WIN_HEIGHT = 800
 WIN_WIDTH = 500
 DRAW_LINES = False
 GEN = 0  # declaring generation variable
+GENERATIONS = 50  # generations a run trains for, a resumed run only for the ones that are left
+DECISION_INTERVAL = 1  # the networks are asked every this many frames and their decision is repeated in between
+VIDEO_FRAMES = 900  # best genome clips are cut after this many frames, 30 seconds
+# headless generations end after this many frames (20 minutes of game time, far past the fitness threshold), so a
+# genome that never crashes cannot keep a generation running forever
+HEADLESS_MAX_FRAMES = 36000
 
 
 pygame.display.set_caption("Flappy Bird")
 
-# importing the images of birds, pipes, background and base
-bird_images = [pygame.image.load("assets/bird_down.png"),
-               pygame.image.load("assets/bird_mid.png"),
-               pygame.image.load("assets/bird_up.png")]
-skyline_image = pygame.image.load("assets/background.png")
-ground_image = pygame.image.load("assets/ground.png")
-top_pipe_image = pygame.image.load("assets/pipe_top.png")
-bottom_pipe_image = pygame.image.load("assets/pipe_bottom.png")
-game_over_image = pygame.image.load("assets/game_over.png")
-start_image = pygame.image.load("assets/start.png")
+# the images of birds, pipes, background and base come from the shared asset loader,
+# which only loads an image the first time it is used
+bird_images = assets.AssetImages(assets.BIRD_FRAMES)
 
 # declaring font
 STAT_FONT = pygame.font.SysFont('impact', 50)
@@ -96,63 +117,143 @@ class Bird:
             self.img = self.IMGS[1]
             self.img_number = self.ANIMATION_TIME * 2  # reset the image number so that next image should be IMG[2]
 
-        rotated_image = pygame.transform.rotate(self.img, self.tilt)  # just rotating the image around its center
-        new_rect = rotated_image.get_rect(center=self.img.get_rect(topleft=(self.x, self.y)).center)
-        win.blit(rotated_image, new_rect)
+        # just rotating the image around its center, every (image, tilt) pair is only rotated once
+        blit_rotated(win, self.img, self.tilt, (self.x, self.y))
 
     def get_mask(self):  # getting the mask of the bird means the contour of bird to check its collision with any pipe
-        return pygame.mask.from_surface(self.img)
+        return collision.get_mask(self.img)
+
+
+# struct-of-arrays version of Bird for a whole population: every array is indexed by bird number and
+# dead birds stay in place with alive set to False, so genomes and networks keep the same index
+class BirdPopulation:
+    ROTATION_VEL = Bird.ROTATION_VEL
+    MAX_ROTATION = Bird.MAX_ROTATION
+    ANIMATION_TIME = Bird.ANIMATION_TIME
+    IMGS = bird_images
+
+    def __init__(self, size, x, y):
+        self.x = x  # all birds fly at the same x
+        self.y = np.full(size, y, dtype=float)
+        self.height = self.y.copy()
+        self.frame_count = np.zeros(size, dtype=int)
+        self.tilt = np.zeros(size)
+        self.vel = np.zeros(size)
+        self.img_number = np.zeros(size, dtype=int)
+        self.img_index = np.zeros(size, dtype=int)  # which of IMGS each bird is showing
+        self.img_widths = np.array([assets.size(name)[0] for name in assets.BIRD_FRAMES])
+        self.img_heights = np.array([assets.size(name)[1] for name in assets.BIRD_FRAMES])
+        self.alive = np.ones(size, dtype=bool)
+
+    def __len__(self):
+        return len(self.y)
+
+    def jump(self, mask):  # same as Bird.jump for every alive bird where mask is True
+        mask = mask & self.alive
+        self.vel[mask] = -10.5
+        self.frame_count[mask] = 0
+        self.height[mask] = self.y[mask]
+
+    def move(self):  # same kinematics as Bird.move, applied to all alive birds in one step
+        alive = self.alive
+        self.frame_count[alive] += 1
+        t = self.frame_count
+        d = np.minimum(self.vel * t + 1.5 * t ** 2, 16)  # falling is clamped to 16 pixels per frame
+        self.y[alive] += d[alive]
+
+        rising = alive & ((d < 0) | (self.y < self.height + 50))
+        self.tilt[rising & (self.tilt < self.MAX_ROTATION)] = self.MAX_ROTATION
+        falling = alive & ~rising & (self.tilt > -90)
+        self.tilt[falling] -= self.ROTATION_VEL
+
+    def out_of_bounds(self):  # alive birds which hit the ground or flew above the window
+        return self.alive & ((self.y + self.img_heights[self.img_index] >= 630) | (self.y < 0))
+
+    def kill(self, mask):
+        self.alive[mask] = False
+
+    # advances the flapping animation of the alive birds by one frame. The windowed loops call it every frame
+    # whether the frame is drawn or not, the frame shown also picks the collision mask of the bird
+    def animate(self):
+        alive = self.alive
+        self.img_number[alive] += 1
+
+        # same flapping animation as Bird.draw, worked out for all birds at once
+        n = self.img_number
+        animation = np.select([n < self.ANIMATION_TIME, n < self.ANIMATION_TIME * 2,
+                               n < self.ANIMATION_TIME * 3, n < self.ANIMATION_TIME * 4], [0, 1, 2, 1], 0)
+        self.img_index[alive] = animation[alive]
+        self.img_number[alive & (n >= self.ANIMATION_TIME * 4)] = 0
+
+        nose_diving = alive & (self.tilt < -80)  # nose diving birds do not flap their wings
+        self.img_index[nose_diving] = 1
+        self.img_number[nose_diving] = self.ANIMATION_TIME * 2
+
+    def draw(self, win, visible=None):  # visible picks the birds to draw, all alive birds when None
+        if visible is None:
+            visible = np.flatnonzero(self.alive)
+        for i in visible:
+            blit_rotated(win, self.IMGS[self.img_index[i]], self.tilt[i], (self.x, self.y[i]))
 
 
 class Pipe:
     GAP = 200
     VEL = 5
+    TOP_PIPE = assets.AssetImage('pipe_top')
+    BOTTOM_PIPE = assets.AssetImage('pipe_bottom')
 
-    def __init__(self, x):
+    def __init__(self, x, rng=random):
         self.x = x
+        self.rng = rng  # pass a seeded Course to get the same pipes every time
         self.height = 0  # for random purpose
         self.top = 0  # y coordinates of top pipe
         self.bottom = 0  # y coordinates of bottom pipe
-        self.TOP_PIPE = top_pipe_image
-        self.BOTTOM_PIPE = bottom_pipe_image
         self.passed = False
         self.set_height()
 
     def set_height(self):  # randomly setting the heights of both pipes
-        self.height = random.randrange(50, 450)
+        self.height = self.rng.randrange(50, 450)
         self.bottom = self.height + self.GAP
         self.top = self.height - self.TOP_PIPE.get_height()
         # print(self.height, self.bottom, self.top)
 
     def move(self):
         self.x -= self.VEL
-        print(self.x)
 
     def draw(self, win):
         win.blit(self.TOP_PIPE, (self.x, self.top))
         win.blit(self.BOTTOM_PIPE, (self.x, self.bottom))
 
     def collide(self, bird):  # for checking collision of the bird with the pipes
-        bird_mask = bird.get_mask()
-        top_pipe_mask = pygame.mask.from_surface(self.TOP_PIPE)
-        bottom_pipe_mask = pygame.mask.from_surface(self.BOTTOM_PIPE)
-
-        top_offset = (self.x - bird.x, self.top - round(bird.y))
-        bottom_offset = (self.x - bird.x, self.bottom - round(bird.y))
-
-        top_overlap = bird_mask.overlap(top_pipe_mask, top_offset)
-        bottom_overlap = bird_mask.overlap(bottom_pipe_mask, bottom_offset)
-
-        if top_overlap or bottom_overlap:
-            return True
-        return False
+        bird_pos = (bird.x, round(bird.y))
+        # collision.collide only compares the cached masks when the bounding boxes actually intersect
+        return (collision.collide(bird.img, bird_pos, self.TOP_PIPE, (self.x, self.top)) or
+                collision.collide(bird.img, bird_pos, self.BOTTOM_PIPE, (self.x, self.bottom)))
+
+    def collide_population(self, population):  # collide() for every alive bird of a BirdPopulation
+        # bounding box test for the whole population first, so only birds touching a pipe box get a pixel test
+        bird_y = np.round(population.y).astype(int)
+        in_columns = (self.x < population.x + population.img_widths.max() and
+                      population.x < self.x + self.TOP_PIPE.get_width())
+        hits = np.zeros(len(population), dtype=bool)
+        if not in_columns:
+            return hits
+
+        candidates = population.alive & ((bird_y < self.height) |
+                                         (bird_y + population.img_heights[population.img_index] > self.bottom))
+        for i in np.flatnonzero(candidates):
+            img = population.IMGS[population.img_index[i]]
+            bird_pos = (population.x, int(bird_y[i]))
+            hits[i] = (collision.collide(img, bird_pos, self.TOP_PIPE, (self.x, self.top)) or
+                       collision.collide(img, bird_pos, self.BOTTOM_PIPE, (self.x, self.bottom)))
+        return hits
 
 
 # BASE Class for showing base
 class Base:
     VEL = 5
-    IMG = ground_image
-    WIDTH = ground_image.get_width()
+    IMG = assets.AssetImage('ground')
+    WIDTH = assets.size('ground')[0]
 
     def __init__(self, y):  # base will be shown moving by taking two images of the same base and putting it one after other
         self.y = y
@@ -173,67 +274,98 @@ class Base:
         win.blit(self.IMG, (self.x2, self.y))
 
 
-# Our main drawing function
-def draw_window(win, birds, pipes, base, score, GEN, pipe_ind):
+# Our main drawing function, it draws through a DirtyRenderer so only the parts of the window that changed are redrawn.
+# visible picks the birds to draw (all alive birds when None), the events are handled by the loops calling it
+def draw_window(renderer, population, pipes, base, score, GEN, pipe_ind, visible=None):
     global DRAW_LINES
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            quit()
+    if visible is None:
+        visible = np.flatnonzero(population.alive)
 
-    win.blit(skyline_image, (0, 0))
+    renderer.begin_frame()
     for pipe in pipes:
-        pipe.draw(win)
-    base.draw(win)
+        pipe.draw(renderer)
+    base.draw(renderer)
 
-    for bird in birds:
+    for i in visible:
         try:
             if DRAW_LINES:
-                pygame.draw.line(win, (255, 0, 0), (bird.x + bird.img.get_width() / 2, bird.y + bird.img.get_height() / 2),
-                                 (pipes[pipe_ind].x + pipes[pipe_ind].TOP_PIPE.get_width() / 2, pipes[pipe_ind].height), 5)
-                pygame.draw.line(win, (255, 0, 0), (bird.x + bird.img.get_width() / 2, bird.y + bird.img.get_height() / 2),
-                                 (pipes[pipe_ind].x + pipes[pipe_ind].BOTTOM_PIPE.get_width() / 2, pipes[pipe_ind].bottom),
-                                 5)
+                img = population.IMGS[population.img_index[i]]
+                bird_center = (population.x + img.get_width() / 2, population.y[i] + img.get_height() / 2)
+                renderer.track(pygame.draw.line(renderer.window, (255, 0, 0), bird_center,
+                                                (pipes[pipe_ind].x + pipes[pipe_ind].TOP_PIPE.get_width() / 2,
+                                                 pipes[pipe_ind].height), 5))
+                renderer.track(pygame.draw.line(renderer.window, (255, 0, 0), bird_center,
+                                                (pipes[pipe_ind].x + pipes[pipe_ind].BOTTOM_PIPE.get_width() / 2,
+                                                 pipes[pipe_ind].bottom), 5))
         except Exception as e:
             print("Error while drawing lines:", e)
 
-        bird.draw(win)
+    population.draw(renderer, visible)
 
-    text = STAT_FONT.render('Score : ' + str(score), 1, (255, 255, 255))
-    win.blit(text, (WIN_WIDTH - 10 - text.get_width(), 50))
+    text = hud.render(STAT_FONT, 'Score : ' + str(score), 1, (255, 255, 255))
+    renderer.blit(text, (WIN_WIDTH - 10 - text.get_width(), 50))
 
-    alive_text = 'Alive : ' + str(len(birds))
-    alive_text_rendered = STAT_FONT.render(alive_text, 1, (255, 255, 255))
-    win.blit(alive_text_rendered, (10, 50))
+    alive_text = 'Alive : ' + str(np.count_nonzero(population.alive))
+    alive_text_rendered = hud.render(STAT_FONT, alive_text, 1, (255, 255, 255))
+    renderer.blit(alive_text_rendered, (10, 50))
 
-    pygame.display.update()
+    renderer.end_frame()
 
 
 
-def main(genomes, config):
+# headless=True keeps the Bird/Pipe/Base physics but skips the display, event pumping and the fps cap,
+# so training runs as fast as the cpu allows; the windowed path is only for watching runs.
+# seed fixes the pipe heights so separate worlds of the same generation see the same pipes, without it the
+# generation's course seed is derived from course_seed. decision_interval > 1 only queries the networks every
+# that many frames, the physics still run every frame. A TrajectoryRecorder passed as recorder logs every frame
+# and max_frames ends the generation after that many frames even if some birds are still flying.
+# A FrameProfiler passed as profiler times the phases of every frame. turbo is the TurboControl that sets the
+# speed of a windowed run, keep passing the same one so the speed picked with the keys carries over generations.
+# A BestGenomeVideo passed as video is handed every frame to record the best genome of the generation.
+# With a FitnessCache passed as cache the genomes that already flew this course take their fitness from it
+# instead of flying again (and are not drawn)
+def main(genomes, config, headless=False, seed=None, decision_interval=DECISION_INTERVAL, course_seed=None,
+         recorder=None, max_frames=None, profiler=None, turbo=None, video=None, cache=None):
     global GEN, game_started
     GEN += 1
-    birds = []
+    if seed is None:
+        seed = generation_seed(course_seed, GEN)
+    if cache is not None:
+        genomes = cache.lookup(genomes, seed)
+        if not genomes:
+            return
     ge = []
     neural_networks = []
-    
-    pygame.init()
-    win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-    pygame.display.set_caption("Flappy Bird")
+
+    if not headless:
+        pygame.init()
+        win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+        pygame.display.set_caption("Flappy Bird")
+        renderer = DirtyRenderer(win, assets.image('background'))
+        if turbo is None:
+            turbo = TurboControl(30, caption="Flappy Bird")
+        turbo.reset()
 
     for _, g in genomes:
         net = neat.nn.FeedForwardNetwork.create(g, config)
         neural_networks.append(net)
-        birds.append(Bird(230, 350))
         g.fitness = 0
         ge.append(g)
+    population = BirdPopulation(len(ge), 230, 350)
+    population_network = PopulationNetwork.create(neural_networks)  # all networks evaluated in one batched call
+    fitness = np.zeros(len(ge))  # written back to the genomes once the generation is over
 
-    pipes = [Pipe(500)]  # list of pipe objects
+    course = Course(seed)
+    pipes = [Pipe(500, course)]  # list of pipe objects
     base_object = Base(630)
-    win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
-    clock = pygame.time.Clock()
     run = True
     score = 0
+    frame = 0
+    jumps = np.zeros(len(population), dtype=bool)
+    if recorder is not None:
+        recorder.start_generation(GEN, seed, len(population))
+    if video is not None:
+        video.begin(GEN, seed, len(population))
     # while game_started == False:
     #     win.fill((0, 0, 0))
     #     win.blit(skyline_image, (0, 0))
@@ -254,72 +386,360 @@ def main(genomes, config):
     # OUR main running loop
 
     while run:
-        
-        clock.tick(30)  # fps
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:  # if the user click on the red cross button then quit the game
-                run = False
-                pygame.quit()
-                quit()
-
+        if profiler is not None:
+            profiler.start_frame('physics')
+        if not headless:
+            # waits for the step at the current speed and pumps the events, 1, 2, 3 and 0 switch between
+            # 1x, 10x, max and no drawing
+            turbo.tick(profiler)
+
+        if profiler is not None:
+            profiler.enter('physics')
         pipe_ind = 0
 
         # this part is done to check in the case when 2 pipes appear on the screen that which is the pipe we are evaluating on
-        if len(birds) > 0:
-            if len(pipes) > 1 and birds[0].x > pipes[0].x + pipes[0].TOP_PIPE.get_width():
+        if population.alive.any():
+            if len(pipes) > 1 and population.x > pipes[0].x + pipes[0].TOP_PIPE.get_width():
                 pipe_ind = 1
 
         else:  # if all the birds are dead then exit the loop
             break
 
-        for x, bird in enumerate(birds):  # traversing every bird
-            bird.move()
-            ge[x].fitness += 0.1  # incrementing little fitness to keep them moving
-            # this is the output list which the nn is giving for all the birds whether to jump or not
-            output = neural_networks[x].activate((bird.y, abs(bird.y - pipes[pipe_ind].height),
-                                                  abs(bird.y - pipes[pipe_ind].bottom)))
-            if output[0] > 0.5:
-                bird.jump()
-
+        population.move()  # moving every alive bird in one step
+        fitness[population.alive] += 0.1  # incrementing little fitness to keep them moving
+
+        # this is the output which the nn is giving for all the birds whether to jump or not,
+        # on the frames in between decisions the last decision is repeated
+        if frame % decision_interval == 0:
+            if profiler is not None:
+                profiler.enter('inference')
+            inputs = np.column_stack((population.y, np.abs(population.y - pipes[pipe_ind].height),
+                                      np.abs(population.y - pipes[pipe_ind].bottom)))
+            output = population_network.activate(inputs, population.alive)
+            jumps = output[:, 0] > 0.5
+            if profiler is not None:
+                profiler.enter('physics')
+        population.jump(jumps)
+
+        if profiler is not None:
+            profiler.enter('collision')
         for pipe in pipes:
-            for x, bird in enumerate(birds):
-                # checking if the bird has hit the ground or if the pipe and bird collide
-                if pipe.collide(bird) or (bird.y + bird.img.get_height() >= 630 or bird.y < 0):
-                    ge[x].fitness -= 1  # remove all things of that bird from that bird's position
-                    birds.pop(x)
-                    ge.pop(x)
-                    neural_networks.pop(x)
-
-                if not pipe.passed and bird.x > pipe.x:  # if the passed is not set to true and bird has passed the pipe then set it to true
-                    pipe.passed = True
-                    for g in ge:
-                        g.fitness += 5  # adding fitness to birds which passed
-                    score += 1
-                    pipes.append(Pipe(500))  # add another pipe
+            # checking if the bird has hit the ground or if the pipe and bird collide
+            dead = population.alive & (pipe.collide_population(population) | population.out_of_bounds())
+            fitness[dead] -= 1
+            population.kill(dead)
+
+            # if the passed is not set to true and the birds have passed the pipe then set it to true
+            if not pipe.passed and population.alive.any() and population.x > pipe.x:
+                pipe.passed = True
+                fitness[population.alive] += 5  # adding fitness to birds which passed
+                score += 1
+                pipes.append(Pipe(500, course))  # add another pipe
 
             if pipe.x + pipe.TOP_PIPE.get_width() < 0:  # if pipe passed the screen add it to remove list
                 pipes.remove(pipe)
 
             pipe.move()
 
+        if profiler is not None:
+            profiler.enter('physics')
         base_object.move()
-        draw_window(win, birds, pipes, base_object, score, GEN, pipe_ind)
+        if recorder is not None or video is not None:
+            if profiler is not None:
+                profiler.enter('recording')
+            if recorder is not None:
+                recorder.record_frame(frame, population, jumps)
+            if video is not None:
+                video.record_frame(frame, population)
+        if not headless:
+            if profiler is not None:
+                profiler.enter('drawing')
+            population.animate()
+            if turbo.render:
+                draw_window(renderer, population, pipes, base_object, score, GEN, pipe_ind,
+                            turbo.visible(population.alive, fitness))
+        if profiler is not None:
+            profiler.end_frame()
+        frame += 1
+        if max_frames is not None and frame >= max_frames:
+            break
+
+    for g, f in zip(ge, fitness):
+        g.fitness = float(f)
+    if cache is not None:
+        cache.store(genomes, seed)
+
+    if not headless and video is None:  # a BestGenomeVideo still draws the clip of this generation with pygame
+        pygame.quit()
+
+
+# pipes, base and score of a replayed generation, rebuilt from its course seed. step() puts the birds where a log
+# says they were in the next frame, so no network is evaluated and no collision is checked
+class ReplayWorld:
+    def __init__(self, seed, population_size):
+        self.population = BirdPopulation(population_size, 230, 350)
+        self.course = Course(seed)
+        self.pipes = [Pipe(500, self.course)]
+        self.base = Base(630)
+        self.score = 0
+        self.pipe_ind = 0
+
+    def step(self, birds, y, tilt):  # birds are the indices of the birds alive in the frame, y and tilt their state
+        population = self.population
+        population.alive[:] = False
+        population.alive[birds] = True
+        population.y[birds] = y
+        population.tilt[birds] = tilt
+
+        self.pipe_ind = 0
+        if len(self.pipes) > 1 and population.x > self.pipes[0].x + self.pipes[0].TOP_PIPE.get_width():
+            self.pipe_ind = 1
+
+        for pipe in self.pipes:  # same pipe bookkeeping as main
+            if not pipe.passed and population.x > pipe.x:
+                pipe.passed = True
+                self.score += 1
+                self.pipes.append(Pipe(500, self.course))
+            if pipe.x + pipe.TOP_PIPE.get_width() < 0:
+                self.pipes.remove(pipe)
+            pipe.move()
+
+        self.base.move()
+        population.animate()
+
+    def draw(self, renderer, generation):
+        draw_window(renderer, self.population, self.pipes, self.base, self.score, generation, self.pipe_ind)
+
+
+# re-renders one generation of a trajectory log
+def replay(path, generation):
+    seed, population_size, records = read_generation(path, generation)
+
+    pygame.init()
+    win = pygame.display.set_mode((WIN_WIDTH, WIN_HEIGHT))
+    pygame.display.set_caption("Flappy Bird - generation {0}".format(generation))
+    loop = GameLoop(30)
+    renderer = DirtyRenderer(win, assets.image('background'))
+    world = ReplayWorld(seed, population_size)
+
+    for frame_records in split_frames(records):
+        loop.tick()
+        world.step(frame_records['bird'], frame_records['y'], frame_records['tilt'])
+        if loop.render:
+            world.draw(renderer, generation)
 
     pygame.quit()
 
 
-def run(config_path):
-    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
-                                neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
-    population = neat.Population(config)
+# Records the best genome of every generation as a video clip (see video.VideoWriter). main() hands it the state
+# of every bird in every frame, which is only kept in memory while the generation runs. Once NEAT knows the best
+# genome only its states are handed to a render thread, which draws them with draw_window onto an offscreen
+# surface (no window needed: headless runs, the SDL dummy driver) and queues the pixels for the writer thread, so
+# the next generation starts right away instead of waiting for the clip to be drawn and written. The clip is drawn
+# after the fact, so the render thread waits for the writer when it falls behind and no frame is dropped.
+# Clips are cut after max_frames frames
+class BestGenomeVideo(BaseReporter):
+    def __init__(self, directory, max_frames=VIDEO_FRAMES, fps=30):
+        self.writer = VideoWriter(directory)
+        self.max_frames = max_frames
+        self.fps = fps
+        self.surface = None  # only drawn on by the render thread
+        self.generation = None
+        self.seed = None
+        self.frames = []  # (y, tilt, alive) of every bird in every frame of the current generation
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def begin(self, generation, seed, population_size):
+        self.generation = generation
+        self.seed = seed
+        self.frames = []
+
+    def record_frame(self, frame, population):
+        if len(self.frames) < self.max_frames:
+            self.frames.append((population.y.copy(), population.tilt.copy(), population.alive.copy()))
+
+    def post_evaluate(self, config, population, species, best_genome):
+        bird = list(population).index(best_genome.key)  # genomes are evaluated in the order of the population
+        if self.surface is None:
+            assets.prepare_offscreen()
+            self.surface = pygame.Surface((WIN_WIDTH, WIN_HEIGHT), 0, 32)
+        for name in assets.FILES:  # loaded here, so the render thread never builds the atlas behind the game's back
+            assets.image(name)
+        states = []
+        for y, tilt, alive in self.frames:
+            if not alive[bird]:
+                break
+            states.append((y[bird], tilt[bird]))
+        self.queue.put((self.generation, self.seed, best_genome.key, best_genome.fitness, states))
+        self.frames = []
+
+    # waits until every clip is drawn and on disk and stops the render and writer threads
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # rendering failed, the rest is drained so training never notices until close()
+            try:
+                self.render(*item)
+            except Exception as e:
+                self.error = e
+
+    def render(self, generation, seed, genome, fitness, states):
+        renderer = DirtyRenderer(self.surface, assets.image('background'), update_display=False)
+        world = ReplayWorld(seed, 1)
+        self.writer.start_clip('generation_{0:04d}'.format(generation), self.surface, self.fps,
+                               generation=generation, genome=genome, fitness=fitness, course_seed=seed)
+        for y, tilt in states:
+            world.step([0], y, tilt)
+            world.draw(renderer, generation)
+            self.writer.write(capture(self.surface), block=True)
+        self.writer.end_clip()
+
+
+# runs a chunk of genomes in its own headless world inside a ParallelEvaluator worker process
+def eval_genome_chunk(genomes, config, seed, decision_interval=DECISION_INTERVAL, max_frames=HEADLESS_MAX_FRAMES):
+    main(genomes, config, headless=True, seed=seed, decision_interval=decision_interval, max_frames=max_frames)
+    return [g.fitness for _, g in genomes]
+
+
+# workers evaluates every generation in that many headless worker processes instead of one shared world.
+# course_seed makes the pipe courses of the run reproducible, record writes a trajectory log for replay() and
+# profile prints where the frame time of every generation went. speed is the starting speed of a windowed run,
+# render_every only draws every that many frames and draw_top only draws the best that many birds.
+# video writes a clip of the best genome of every generation into that directory, at most video_frames long.
+# checkpoint writes a checkpoint of the population after every generation and the best genome so far into that
+# directory, resume continues the run of a checkpoint (or of the newest one in a directory) and warm_start starts
+# from mutated copies of a saved genome instead of random ones. export writes the winner to that file as a policy
+# module bird.py --autopilot can fly with. fixed_course flies every generation on the same course (the one of
+# course_seed) and fitness_cache keeps the fitness of that many genomes, so the elites, which come back unchanged
+# every generation, are not simulated again on a course they already flew. max_frames ends every generation after
+# that many frames, by default headless runs and workers stop at HEADLESS_MAX_FRAMES and windowed runs never do.
+# Returns the winner
+def run(config_path, headless=False, workers=None, decision_interval=DECISION_INTERVAL, course_seed=None,
+        record=None, profile=False, speed='1x', render_every=1, draw_top=None, video=None, video_frames=VIDEO_FRAMES,
+        checkpoint=None, resume=None, warm_start=None, export=None, fixed_course=False, fitness_cache=None,
+        max_frames=None):
+    global GEN
+    if workers and record:
+        raise ValueError("trajectories can only be recorded without worker processes")
+    if workers and video:
+        raise ValueError("videos can only be recorded without worker processes")
+    if workers and profile:
+        raise ValueError("frames can only be profiled without worker processes")
+    if fitness_cache and (record or video):
+        raise ValueError("the fitness cache skips genomes, trajectories and videos need every genome to fly")
+
+    if resume:
+        population = restore_population(resume)
+    else:
+        config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                    neat.DefaultSpeciesSet, neat.DefaultStagnation, config_path)
+        population = neat.Population(config)
+        if warm_start:
+            seed_population(population, load_genome(warm_start))
+    if population.generation >= GENERATIONS:
+        raise ValueError("{0} is already at generation {1}, the run of {2} generations is over"
+                         .format(resume, population.generation, GENERATIONS))
+    GEN = population.generation  # the courses of a resumed run go on from where it stopped
     population.add_reporter(neat.StdOutReporter(True))
     stats = neat.StatisticsReporter()
     population.add_reporter(stats)
-
-    winner = population.run(main, 50)
+    profiler = FrameProfiler() if profile else None
+    if profiler is not None:
+        population.add_reporter(ProfileReporter(profiler))
+
+    recorder = TrajectoryRecorder(record) if record else None
+    video_recorder = BestGenomeVideo(video, video_frames) if video else None
+    if video_recorder is not None:
+        population.add_reporter(video_recorder)
+    checkpointer = NeatCheckpointer(checkpoint) if checkpoint else None
+    if checkpointer is not None:
+        population.add_reporter(checkpointer)
+    fixed_seed = generation_seed(course_seed, 0) if fixed_course else None
+    if max_frames is None and (headless or workers):
+        max_frames = HEADLESS_MAX_FRAMES
+    cache = FitnessCache(fitness_cache) if fitness_cache else None
+    if workers:
+        evaluator = ParallelEvaluator(workers, partial(eval_genome_chunk, decision_interval=decision_interval,
+                                                       max_frames=max_frames),
+                                      seed=course_seed, fixed_seed=fixed_seed, cache=cache)
+        evaluator.generation = population.generation
+        eval_function = evaluator.evaluate
+    else:
+        turbo = None if headless else TurboControl(30, speed, render_every, draw_top=draw_top, caption="Flappy Bird")
+        eval_function = partial(main, headless=headless, seed=fixed_seed, decision_interval=decision_interval,
+                                course_seed=course_seed, recorder=recorder, profiler=profiler, turbo=turbo,
+                                video=video_recorder, cache=cache, max_frames=max_frames)
+    try:
+        winner = population.run(eval_function, GENERATIONS - population.generation)
+    finally:  # also on Ctrl+C, so the checkpoints and clips written so far are complete
+        if checkpointer is not None:
+            checkpointer.close()
+        if video_recorder is not None:
+            video_recorder.close()
+    if workers:
+        evaluator.close()
+    if recorder is not None:
+        recorder.close()
+    if cache is not None:
+        print('fitness cache: {0} of {1} evaluations skipped'.format(cache.hits, cache.hits + cache.misses))
     print('\nBest genome:\n{!s}'.format(winner))
+    if export:
+        export_policy(winner, population.config, export)
+    return winner
 
 
 if __name__ == '__main__':
-    config_path = "config-feedforward.txt"
-    run(config_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--headless', action='store_true', help='train without opening a window')
+    parser.add_argument('--workers', type=int, default=None, help='evaluate genomes in this many worker processes')
+    parser.add_argument('--decision-interval', type=int, default=DECISION_INTERVAL,
+                        help='ask the networks every this many frames and repeat their decision in between')
+    parser.add_argument('--course-seed', type=int, default=None, help='base seed of the pipe courses')
+    parser.add_argument('--record', metavar='PATH', help='write a trajectory log of every generation')
+    parser.add_argument('--replay', metavar='PATH', help='replay a generation from a trajectory log instead of training')
+    parser.add_argument('--generation', type=int, default=1, help='generation to replay')
+    parser.add_argument('--profile', action='store_true', help='print a frame time profile of every generation')
+    parser.add_argument('--speed', choices=list(SPEEDS), default='1x',
+                        help='starting speed of a windowed run, switch it with the keys 1, 2, 3 and 0 while it runs')
+    parser.add_argument('--render-every', type=int, default=1, help='only draw every this many frames')
+    parser.add_argument('--draw-top', type=int, default=None, help='only draw the best this many birds')
+    parser.add_argument('--video', metavar='DIR', help='write a clip of the best genome of every generation')
+    parser.add_argument('--video-frames', type=int, default=VIDEO_FRAMES, help='longest clip in frames')
+    parser.add_argument('--checkpoint', metavar='DIR', help='checkpoint the population every generation into DIR')
+    parser.add_argument('--resume', metavar='PATH', help='continue from a checkpoint, or the newest one in a directory')
+    parser.add_argument('--warm-start', metavar='GENOME', help='start from mutated copies of a saved genome')
+    parser.add_argument('--export', metavar='PATH', help='write the winner as a policy module for bird.py --autopilot')
+    parser.add_argument('--fixed-course', action='store_true', help='fly every generation on the same course')
+    parser.add_argument('--fitness-cache', type=int, nargs='?', const=CACHE_SIZE, default=None, metavar='SIZE',
+                        help='remember the fitness of this many genomes (default {0}) and skip the ones that fly a '
+                             'course again'.format(CACHE_SIZE))
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help='end every generation after this many frames (default {0} headless or with workers, '
+                             'no limit in a window)'.format(HEADLESS_MAX_FRAMES))
+    args = parser.parse_args()
+    if args.decision_interval < 1:
+        parser.error('--decision-interval must be at least 1')
+
+    if args.replay:
+        replay(args.replay, args.generation)
+    else:
+        config_path = "config-feedforward.txt"
+        run(config_path, headless=args.headless, workers=args.workers, decision_interval=args.decision_interval,
+            course_seed=args.course_seed, record=args.record, profile=args.profile, speed=args.speed,
+            render_every=args.render_every, draw_top=args.draw_top, video=args.video,
+            video_frames=args.video_frames, checkpoint=args.checkpoint, resume=args.resume,
+            warm_start=args.warm_start, export=args.export, fixed_course=args.fixed_course,
+            fitness_cache=args.fitness_cache, max_frames=args.max_frames)
\ No newline at end of file
@@ -0,0 +1,161 @@
+import os
+import copy
+import gzip
+import queue
+import pickle
+import random
+import tempfile
+import threading
+from itertools import count
+import neat
+from neat.reporting import BaseReporter, ReporterSet
+
+NEAT_PREFIX = 'neat-checkpoint-'  # NEAT checkpoints are NEAT_PREFIX + the generation they continue with
+BEST_GENOME = 'best_genome.pkl'
+
+
+# writes data to path so that path always holds either the old or the whole new file, even when the process dies
+# halfway: the data goes into a temporary file next to it first, which then replaces path in one rename
+def atomic_write(path, data):
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporary, 0o644)  # mkstemp only lets the owner read it
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+# Writes checkpoints on a background thread. The training loop only pickles its state (so the checkpoint is a
+# snapshot of one moment) and hands the bytes over, compressing and writing them happens on the writer thread
+class CheckpointWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # queues data to be written to path (gzipped when compress), the files in remove are deleted once it is written
+    def write(self, path, data, compress=False, remove=()):
+        self.queue.put((path, data, compress, remove))
+
+    # waits until every queued checkpoint is on disk and stops the writer thread
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # the writer failed, the rest is drained so training never notices until close()
+            path, data, compress, remove = item
+            try:
+                atomic_write(path, gzip.compress(data, compresslevel=5) if compress else data)
+                for old in remove:
+                    if os.path.exists(old):
+                        os.remove(old)
+            except Exception as e:
+                self.error = e
+
+
+# neat reporter that checkpoints the population every generation_interval generations into directory, in the
+# format of neat.Checkpointer (population, species and the state of the random module, so either can restore it)
+# but written atomically on a background thread. Only the last keep checkpoints are kept. The best genome so far
+# is written to BEST_GENOME whenever it improves, so an interrupted run still leaves its winner behind
+class NeatCheckpointer(BaseReporter):
+    def __init__(self, directory, generation_interval=1, keep=3):
+        self.directory = directory
+        self.generation_interval = generation_interval
+        self.keep = keep
+        self.writer = CheckpointWriter()
+        self.generation = None
+        self.best_fitness = None
+        self.saved = []
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        if self.best_fitness is None or best_genome.fitness > self.best_fitness:
+            self.best_fitness = best_genome.fitness
+            self.writer.write(os.path.join(self.directory, BEST_GENOME),
+                              pickle.dumps(best_genome, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def end_generation(self, config, population, species_set):
+        next_generation = self.generation + 1  # the population is already the next one, not evaluated yet
+        if next_generation % self.generation_interval != 0:
+            return
+        path = os.path.join(self.directory, NEAT_PREFIX + str(next_generation))
+        species_set = copy.copy(species_set)
+        species_set.reporters = ReporterSet()  # the reporters of this run (threads, files) are not part of the state
+        data = (next_generation, config, population, species_set, random.getstate())
+        self.saved.append(path)
+        old, self.saved = self.saved[:-self.keep], self.saved[-self.keep:]
+        self.writer.write(path, pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), compress=True, remove=old)
+
+    def close(self):  # waits for the writer to finish the last checkpoint
+        self.writer.close()
+
+
+# the newest NEAT checkpoint in directory, None when there is none
+def latest_checkpoint(directory):
+    generations = [int(name[len(NEAT_PREFIX):]) for name in os.listdir(directory)
+                   if name.startswith(NEAT_PREFIX) and name[len(NEAT_PREFIX):].isdigit()]
+    if not generations:
+        return None
+    return os.path.join(directory, NEAT_PREFIX + str(max(generations)))
+
+
+# the neat.Population saved in a checkpoint (or the newest one of a directory), with the random module back in the
+# state it had, so the run continues as if it had never stopped
+def restore_population(path):
+    if os.path.isdir(path):
+        checkpoint = latest_checkpoint(path)
+        if checkpoint is None:
+            raise ValueError("no NEAT checkpoint in {0}".format(path))
+        path = checkpoint
+    with gzip.open(path) as f:
+        generation, config, population, species_set, random_state = pickle.load(f)
+    random.setstate(random_state)
+    restored = neat.Population(config, (population, species_set, generation))
+    species_set.reporters = restored.reporters
+    # a new DefaultReproduction numbers genomes from 1 again, which would hand the keys of the genomes still alive
+    # to their children
+    restored.reproduction.genome_indexer = count(max(population) + 1)
+    return restored
+
+
+# a genome saved by NeatCheckpointer (BEST_GENOME), for warm starts and export_policy.py
+def load_genome(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# warm start: replaces every genome of a new population by a copy of genome (the winner of an earlier run), all but
+# one of them mutated once, and sorts them into species again
+def seed_population(population, genome):
+    config = population.config
+    config.genome_config.node_indexer = None  # new nodes are numbered on from the nodes of genome
+    genomes = {}
+    for i, key in enumerate(population.population):
+        child = copy.deepcopy(genome)
+        child.key = key
+        child.fitness = None
+        if i:
+            child.mutate(config.genome_config)
+        genomes[key] = child
+    population.population = genomes
+    population.species = config.species_set_type(config.species_set_config, population.reporters)
+    population.species.speciate(config, population.population, population.generation)
@@ -0,0 +1,26 @@
+import pygame
+
+# pygame.mask.from_surface walks every pixel of the image, so masks are built once per surface and reused for every
+# collision check after that
+_masks = {}
+
+
+def get_mask(surface):
+    mask = _masks.get(surface)
+    if mask is None:
+        mask = _masks[surface] = pygame.mask.from_surface(surface)
+    return mask
+
+
+def boxes_overlap(x1, y1, w1, h1, x2, y2, w2, h2):  # cheap bounding box test done before any pixel test
+    return x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1
+
+
+def collide(surface1, pos1, surface2, pos2):  # pixel perfect collision of two images drawn at the given positions
+    x1, y1 = pos1
+    x2, y2 = pos2
+    w1, h1 = surface1.get_size()
+    w2, h2 = surface2.get_size()
+    if not boxes_overlap(x1, y1, w1, h1, x2, y2, w2, h2):
+        return False
+    return get_mask(surface1).overlap(get_mask(surface2), (x2 - x1, y2 - y1)) is not None
@@ -0,0 +1,28 @@
+import random
+
+
+# Derives the course seed of one generation (or episode) from a base seed; without a base seed every generation
+# gets a fresh random seed, which is still recorded so the course can be rebuilt later
+def generation_seed(base_seed, generation):
+    if base_seed is None:
+        return random.randrange(2 ** 32)
+    return (base_seed * 1000003 + generation) % 2 ** 32
+
+
+# A seeded random.Random that knows how the games lay out their pipes. It draws the same numbers in the same
+# order as the old unseeded random calls did, so the same seed always gives the same course.
+class Course(random.Random):
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        self.course_seed = seed  # random.Random already has a seed() method
+        super().__init__(seed)
+
+    def pipe_height(self):  # bird.py / bird_ai.py: y where the gap between the two pipes starts
+        return self.randrange(50, 450)
+
+    def pipe_pair(self, gap_range=(110, 130)):  # flappy games: y of the top pipe, gap size and frames to the next pair
+        y_top = self.randint(-600, -480)
+        gap = self.randint(*gap_range)
+        pipe_timer = self.randint(180, 250)
+        return y_top, gap, pipe_timer
@@ -0,0 +1,168 @@
+import os
+import queue
+import pickle
+import threading
+import numpy as np
+from numpy_mlp import NumpyMLP
+from replay_buffer import ReplayBuffer
+
+MAX_QUEUED = 256  # transitions that may wait for the learner before the actor waits for it
+CHECKPOINT = 'dqn-checkpoint.pkl'  # file name of the DQN checkpoint in a checkpoint directory
+# version of the checkpoints: 2 since main.py flaps on action 1 like train_parallel, a model of a version 1
+# checkpoint of main.py has the Q-values of its actions the other way around
+CHECKPOINT_VERSION = 2
+
+
+# Learner half of the DQN: the game loop (the actor) only plays and push()es its transitions, the learner puts them
+# into the replay memory and trains the model on a minibatch every train_every transitions, on a thread of its own
+# so a gradient step never stalls a frame (TensorFlow releases the GIL while it trains, so it runs on spare cores).
+#   - the bootstrapped targets come from a target network, a NumPy copy of the model that only takes over its
+#     weights every target_sync updates, so the targets do not move with every step they are trained towards
+#   - every publish_every updates the new weights are published as `weights`, the actor plays with them by
+#     handing them to its NumPy copy of the model (a reference swap, the published arrays are never changed)
+# At most max_queued transitions wait for the learner, then push() blocks, so a headless actor does not run away
+# from the learner and the ratio of updates to transitions stays the same. threaded=False learns inside push()
+# instead, which makes a run repeatable (benchmarks)
+class Learner:
+    def __init__(self, model, state_size, replay_size=50000, batch_size=64, train_every=4, target_sync=100,
+                 publish_every=1, seed=None, threaded=True, max_queued=MAX_QUEUED):
+        self.model = model  # only touched by the learner thread once it runs
+        self.replay = ReplayBuffer(replay_size, state_size, seed=seed)
+        self.batch_size = batch_size
+        self.train_every = train_every
+        self.target_sync = target_sync
+        self.publish_every = publish_every
+        self.online = NumpyMLP(model)  # Q-values of the trained states, synced after every update
+        self.target = NumpyMLP(model)
+        self.weights = self.online.weights  # latest published weights, see NumpyMLP.weights
+        self.transitions = 0
+        self.updates = 0
+        self.error = None
+        self.thread = None
+        if threaded:
+            self.queue = queue.Queue(max_queued)
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    # hands one transition over, discount is what its bootstrapped value is multiplied with
+    def push(self, state, action, reward, next_state, done, discount):
+        self.hand_over(self.learn, (state, action, reward, next_state, done, discount))
+
+    # hands a batch of transitions over as arrays, e.g. one step of every game of a batched environment
+    def push_batch(self, states, actions, rewards, next_states, dones, discounts):
+        self.hand_over(self.learn_batch, (states, actions, rewards, next_states, dones, discounts))
+
+    def hand_over(self, learn, transitions):
+        if self.thread is None:
+            learn(transitions)
+        else:
+            self.queue.put((learn, transitions))
+
+    # checkpoints the learner into path through a checkpoint.CheckpointWriter, together with the items of extra
+    # (the actor's state, e.g. its exploration rate). The snapshot is taken on the learner thread once every
+    # transition pushed before is learned from, so it is consistent without stopping the game
+    def save(self, writer, path, **extra):
+        self.hand_over(self.write_checkpoint, (writer, path, extra))
+
+    def write_checkpoint(self, item):
+        writer, path, extra = item
+        writer.write(path, pickle.dumps(dict(extra, learner=self.state(), version=CHECKPOINT_VERSION),
+                                        protocol=pickle.HIGHEST_PROTOCOL))
+
+    # everything a resumed run needs: the weights and optimizer state of the model, the target network, the
+    # replay memory and the counters
+    def state(self):
+        return {'weights': self.model.get_weights(),
+                'optimizer': [variable.numpy() for variable in self.model.optimizer.variables],
+                'target': self.target.weights,
+                'replay': self.replay.state(),
+                'transitions': self.transitions,
+                'updates': self.updates}
+
+    # puts the learner back into a saved state(), before anything is pushed
+    def load_state(self, state):
+        self.load_weights(state['weights'])
+        optimizer = self.model.optimizer
+        if not optimizer.built:
+            optimizer.build(self.model.trainable_variables)
+        for variable, value in zip(optimizer.variables, state['optimizer']):
+            variable.assign(value)
+        self.target.weights = state['target']
+        self.replay.load_state(state['replay'])
+        self.transitions = state['transitions']
+        self.updates = state['updates']
+
+    # warm start: the model takes over saved weights, its optimizer and replay memory start afresh
+    def load_weights(self, weights):
+        self.model.set_weights(weights)
+        self.online.sync()
+        self.target.sync()
+        self.weights = self.online.weights
+
+    # waits until every pushed transition is learned from and stops the learner thread
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # the learner failed, the rest is drained so the actor never blocks until close()
+            try:
+                learn, transitions = item
+                learn(transitions)
+            except Exception as e:
+                self.error = e
+
+    def learn(self, transition):
+        self.replay.add(*transition)
+        self.added(1)
+
+    def learn_batch(self, transitions):
+        self.replay.add_batch(*transitions)
+        self.added(len(transitions[1]))
+
+    # trains a minibatch for every train_every transitions that came in
+    def added(self, count):
+        due = (self.transitions + count) // self.train_every - self.transitions // self.train_every
+        self.transitions += count
+        if len(self.replay) >= self.batch_size:
+            for _ in range(due):
+                self.train()
+
+    def train(self):
+        self.update(*self.replay.sample(self.batch_size))
+        self.updates += 1
+        self.online.sync()
+        if self.updates % self.target_sync == 0:
+            self.target.sync()
+        if self.updates % self.publish_every == 0:
+            self.weights = self.online.weights
+
+    # one step of the Bellman update on a minibatch: the taken actions are trained towards the reward plus the
+    # discounted best Q-value of the target network in the next state, the other actions towards what they are
+    def update(self, states, actions, rewards, next_states, dones, discounts):
+        q_values = self.online.predict(states)
+        targets = rewards + discounts * np.max(self.target.predict(next_states), axis=1) * (1 - dones)
+        q_values[np.arange(len(actions)), actions] = targets
+        self.model.train_on_batch(states, q_values)
+
+
+# the saved checkpoint in path, a checkpoint file or a directory with a CHECKPOINT in it
+def load_checkpoint(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, CHECKPOINT)
+    with open(path, 'rb') as f:
+        saved = pickle.load(f)
+    version = saved.pop('version', 1)
+    if version != CHECKPOINT_VERSION:
+        raise ValueError("{0} is a version {1} checkpoint, its actions do not mean what they mean now (version {2})"
+                         .format(path, version, CHECKPOINT_VERSION))
+    return saved
@@ -0,0 +1,63 @@
+import os
+import inspect
+import argparse
+import neat
+from neat import aggregations
+from checkpoint import atomic_write, load_genome
+
+CONFIG_PATH = "config-feedforward.txt"
+
+
+# Compiles a genome into a standalone Python module with an activate(inputs) function that returns the same outputs
+# as neat.nn.FeedForwardNetwork.create(genome, config).activate(inputs), without importing neat. The network is
+# flattened in topological order into one line per node, a sum of input times weight products pushed through the
+# node's activation, so playing with it is a handful of multiply-adds and no graph walk. The activation functions
+# the nodes use are copied into the module from neat.activations, so the outputs are the same to the last bit
+def policy_source(genome, config):
+    net = neat.nn.FeedForwardNetwork.create(genome, config)
+    names = {key: 'x{0}'.format(i) for i, key in enumerate(net.input_nodes)}
+    activations = {}
+    lines = []
+    for node, act_func, agg_func, bias, response, links in net.node_evals:
+        if agg_func is not aggregations.sum_aggregation:
+            raise ValueError("node {0} does not sum its inputs, only sum aggregation can be exported".format(node))
+        activations[act_func.__name__] = act_func
+        names[node] = 'node{0}'.format(node) if node >= 0 else 'node_{0}'.format(-node)
+        total = ' + '.join('{0} * {1!r}'.format(names[i], w) for i, w in links) or '0.0'
+        lines.append('    {0} = {1}({2!r} + {3!r} * ({4}))'.format(names[node], act_func.__name__, bias, response,
+                                                                  total))
+    outputs = ', '.join(names.get(node, '0.0') for node in net.output_nodes)  # outputs nothing connects to are 0
+
+    source = ['# Policy exported by export_policy.py from genome {0} (fitness {1}), do not edit.'.format(
+                  genome.key, genome.fitness),
+              '# activate(inputs) takes a sequence of {0} network inputs and returns a tuple of {1} outputs'.format(
+                  len(net.input_nodes), len(net.output_nodes)),
+              'import math', '',
+              'NUM_INPUTS = {0}'.format(len(net.input_nodes)),
+              'NUM_OUTPUTS = {0}'.format(len(net.output_nodes)), '']
+    for name in sorted(activations):
+        source += ['', inspect.getsource(activations[name]).rstrip(), '']
+    source += ['', 'def activate(inputs):',
+               '    {0}{1} = inputs'.format(', '.join(names[key] for key in net.input_nodes),
+                                         ',' if len(net.input_nodes) == 1 else '')]
+    source += lines
+    source += ['    return ({0},)'.format(outputs), '']
+    return '\n'.join(source)
+
+
+# writes the policy module of genome to path
+def export(genome, config, path):
+    atomic_write(path, policy_source(genome, config).encode())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compile a saved genome into a standalone policy module')
+    parser.add_argument('genome', help='pickled genome, e.g. the best_genome.pkl of a --checkpoint directory')
+    parser.add_argument('--output', '-o', default='policy.py', help='Python file the policy is written to')
+    parser.add_argument('--config', default=CONFIG_PATH, help='NEAT config the genome was trained with')
+    args = parser.parse_args()
+
+    config = neat.config.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                                neat.DefaultSpeciesSet, neat.DefaultStagnation, args.config)
+    export(load_genome(args.genome), config, args.output)
+    print("policy written to", os.path.abspath(args.output))
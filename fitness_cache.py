@@ -0,0 +1,56 @@
+import hashlib
+from collections import OrderedDict
+
+CACHE_SIZE = 1000  # fitnesses a FitnessCache keeps by default, a few generations of a population of 100
+
+
+# digest of everything about a genome that its network depends on: the attributes of every node and connection
+# gene (bias, response, activation, aggregation, weight, enabled). The genome key and fitness are left out, so an
+# elite carried over unchanged or an identical copy under another key gets the same digest
+def genome_hash(genome):
+    nodes = sorted((key, tuple(getattr(gene, a.name) for a in gene._gene_attributes))
+                   for key, gene in genome.nodes.items())
+    connections = sorted((key, tuple(getattr(gene, a.name) for a in gene._gene_attributes))
+                         for key, gene in genome.connections.items())
+    return hashlib.blake2b(repr((nodes, connections)).encode(), digest_size=16).digest()
+
+
+# Fitness of genomes that already flew a course, keyed by genome_hash and the course seed, so a genome that comes
+# back unchanged to a course it flew (the elites, when every generation flies the same course) gets its fitness
+# without being simulated again, and the same fitness it had. The courses are deterministic, so this is exact as
+# long as the game stays the same, which is why a cache only lives as long as one run with one set of settings.
+# Holds at most max_size fitnesses, the least recently used one is dropped first
+class FitnessCache:
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.fitnesses = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.fitnesses)
+
+    # gives the genomes (neat's (key, genome) pairs) found in the cache their fitness and returns the others,
+    # the ones that still have to fly the course of seed
+    def lookup(self, genomes, seed):
+        missing = []
+        for genome_id, genome in genomes:
+            key = (genome_hash(genome), seed)
+            fitness = self.fitnesses.get(key)
+            if fitness is None:
+                missing.append((genome_id, genome))
+                continue
+            self.fitnesses.move_to_end(key)
+            genome.fitness = fitness
+        self.hits += len(genomes) - len(missing)
+        self.misses += len(missing)
+        return missing
+
+    # remembers the fitness the genomes got on the course of seed
+    def store(self, genomes, seed):
+        for _, genome in genomes:
+            key = (genome_hash(genome), seed)
+            self.fitnesses[key] = genome.fitness
+            self.fitnesses.move_to_end(key)
+        while len(self.fitnesses) > self.max_size:
+            self.fitnesses.popitem(last=False)
@@ -1,25 +1,20 @@
 import pygame
-from sys import exit
-import random
+import assets
+import hud
+from course import Course
+from sprite_cache import get_rotated
+from renderer import DirtyRenderer
+from game_loop import GameLoop, wait_for_key
 
 pygame.init()
-clock = pygame.time.Clock()
 
 # Window
 win_height = 720
 win_width = 551
 window = pygame.display.set_mode((win_width, win_height))
 
-# Images
-bird_images = [pygame.image.load("assets/bird_down.png"),
-               pygame.image.load("assets/bird_mid.png"),
-               pygame.image.load("assets/bird_up.png")]
-skyline_image = pygame.image.load("assets/background.png")
-ground_image = pygame.image.load("assets/ground.png")
-top_pipe_image = pygame.image.load("assets/pipe_top.png")
-bottom_pipe_image = pygame.image.load("assets/pipe_bottom.png")
-game_over_image = pygame.image.load("assets/game_over.png")
-start_image = pygame.image.load("assets/start.png")
+# Images, loaded by the shared asset loader the first time they are used
+bird_images = assets.AssetImages(assets.BIRD_FRAMES)
 
 # Game
 scroll_speed = 3
@@ -58,8 +53,8 @@ class Bird(pygame.sprite.Sprite):
         if self.vel == 0:
             self.flap = False
 
-        # Rotate Bird
-        self.image = pygame.transform.rotate(self.image, self.vel * -7)
+        # Rotate Bird, vel only takes 0.5 steps between -7 and 7 so every angle is rotated once and cached
+        self.image = get_rotated(self.image, self.vel * -7).surface
 
         # User Input
         if user_input[pygame.K_SPACE] and not self.flap and self.rect.y > 0 and self.alive:
@@ -70,12 +65,15 @@ class Bird(pygame.sprite.Sprite):
 class Pipe(pygame.sprite.Sprite):
     def __init__(self, x, y, image, pipe_type):
         pygame.sprite.Sprite.__init__(self)
-        self.image = image
-        self.rect = self.image.get_rect()
-        self.rect.x, self.rect.y = x, y
+        self.image_name = image  # asset name, the rect only needs the size from the file header
+        self.rect = pygame.Rect((x, y), assets.size(image))
         self.enter, self.exit, self.passed = False, False, False
         self.pipe_type = pipe_type
 
+    @property
+    def image(self):  # only loaded once the pipe is drawn
+        return assets.image(self.image_name)
+
     def update(self):
         # Move Pipe
         self.rect.x -= scroll_speed
@@ -86,7 +84,6 @@ class Pipe(pygame.sprite.Sprite):
         global score
         if self.pipe_type == 'bottom':
             if bird_start_position[0] > self.rect.topleft[0] and not self.passed:
-                print("Entry")
                 self.enter = True
             if bird_start_position[0] > self.rect.topright[0] and not self.passed:
                 self.exit = True
@@ -96,11 +93,11 @@ class Pipe(pygame.sprite.Sprite):
 
 
 class Ground(pygame.sprite.Sprite):
+    image = assets.AssetImage('ground')  # only loaded once the ground is drawn
+
     def __init__(self, x, y):
         pygame.sprite.Sprite.__init__(self)
-        self.image = ground_image
-        self.rect = self.image.get_rect()
-        self.rect.x, self.rect.y = x, y
+        self.rect = pygame.Rect((x, y), assets.size('ground'))
 
     def update(self):
         # Move Ground
@@ -109,16 +106,11 @@ class Ground(pygame.sprite.Sprite):
             self.kill()
 
 
-def quit_game():
-    # Exit Game
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            exit()
-
-
 # Game Main Method
-def main():
+# policy(bird, pipes) flies the bird instead of the keyboard and ends the game when the bird crashes instead of
+# waiting for R; fps=None runs the loop uncapped, max_frames stops it after that many frames and seed fixes the pipes.
+# The physics run at a fixed fps, frames the loop is behind on are caught up without drawing them
+def main(policy=None, fps=60, max_frames=None, seed=None):
     global score
 
     # Instantiate Bird
@@ -128,38 +120,42 @@ def main():
     # Setup Pipes
     pipe_timer = 0
     pipes = pygame.sprite.Group()
+    course = Course(seed)
 
     # Instantiate Initial Ground
     x_pos_ground, y_pos_ground = 0, 520
     ground = pygame.sprite.Group()
     ground.add(Ground(x_pos_ground, y_pos_ground))
 
+    renderer = DirtyRenderer(window, assets.image('background'))  # only redraws what changed
+    loop = GameLoop(fps)
+    frame = 0
     run = True
     while run:
-        # Quit
-        quit_game()
-
-        # Reset Frame
-        window.fill((0, 0, 0))
+        # Wait for the next step and pump the events
+        loop.tick()
 
         # User Input
         user_input = pygame.key.get_pressed()
-
-        # Draw Background
-        window.blit(skyline_image, (0, 0))
+        if policy is not None:
+            user_input = {pygame.K_SPACE: policy(bird.sprite, pipes), pygame.K_r: False}
 
         # Spawn Ground
         if len(ground) <= 2:
             ground.add(Ground(win_width, y_pos_ground))
 
-        # Draw - Pipes, Ground and Bird
-        pipes.draw(window)
-        ground.draw(window)
-        bird.draw(window)
+        if loop.render:
+            # Reset Frame
+            renderer.begin_frame()
 
-        # Show Score
-        score_text = font.render('Score: ' + str(score), True, pygame.Color(255, 255, 255))
-        window.blit(score_text, (20, 20))
+            # Draw - Pipes, Ground and Bird
+            pipes.draw(renderer)
+            ground.draw(renderer)
+            bird.draw(renderer)
+
+            # Show Score
+            score_text = hud.render(font, 'Score: ' + str(score), True, pygame.Color(255, 255, 255))
+            renderer.blit(score_text, (20, 20))
 
         # Update - Pipes, Ground and Bird
         if bird.sprite.alive:
@@ -173,24 +169,33 @@ def main():
         if collision_pipes or collision_ground:
             bird.sprite.alive = False
             if collision_ground:
+                if policy is not None:
+                    return
+                if loop.render:
+                    renderer.end_frame()
+                game_over_image = assets.image('game_over')
                 window.blit(game_over_image, (win_width // 2 - game_over_image.get_width() // 2,
                                               win_height // 2 - game_over_image.get_height() // 2))
-                if user_input[pygame.K_r]:
-                    score = 0
-                    break
+                pygame.display.update()
+                wait_for_key((pygame.K_r,))  # the game stands still, so it blocks until R instead of redrawing it
+                score = 0
+                break
 
         # Spawn Pipes
         if pipe_timer <= 0 and bird.sprite.alive:
             x_top, x_bottom = 550, 550
-            y_top = random.randint(-600, -480)
-            y_bottom = y_top + random.randint(110, 130) + bottom_pipe_image.get_height()
-            pipes.add(Pipe(x_top, y_top, top_pipe_image, 'top'))
-            pipes.add(Pipe(x_bottom, y_bottom, bottom_pipe_image, 'bottom'))
-            pipe_timer = random.randint(180, 250)
+            y_top, gap, pipe_timer = course.pipe_pair()
+            y_bottom = y_top + gap + assets.size('pipe_bottom')[1]
+            pipes.add(Pipe(x_top, y_top, 'pipe_top', 'top'))
+            pipes.add(Pipe(x_bottom, y_bottom, 'pipe_bottom', 'bottom'))
         pipe_timer -= 2
 
-        clock.tick(60)
-        pygame.display.update()
+        if loop.render:
+            renderer.end_frame()
+
+        frame += 1
+        if max_frames is not None and frame >= max_frames:
+            return
 
 
 # Menu
@@ -198,22 +203,21 @@ def menu():
     global game_stopped
 
     while game_stopped:
-        quit_game()
-
         # Draw Menu
         window.fill((0, 0, 0))
-        window.blit(skyline_image, (0, 0))
-        window.blit(ground_image, Ground(0, 520))
+        window.blit(assets.image('background'), (0, 0))
+        window.blit(assets.image('ground'), Ground(0, 520))
         window.blit(bird_images[0], (100, 250))
+        start_image = assets.image('start')
         window.blit(start_image, (win_width // 2 - start_image.get_width() // 2,
                                   win_height // 2 - start_image.get_height() // 2))
 
-        # User Input
-        user_input = pygame.key.get_pressed()
-        if user_input[pygame.K_SPACE]:
-            main()
-
         pygame.display.update()
 
+        # User Input, the menu does not change so it blocks until SPACE is pressed
+        wait_for_key((pygame.K_SPACE,))
+        main()
+
 
-menu()
+if __name__ == '__main__':
+    menu()
@@ -1,29 +1,40 @@
 import pygame
-import random
+import assets
+import hud
 import neat
+import argparse
+import numpy as np
+from functools import partial
+from course import Course, generation_seed
+from sprite_cache import get_rotated
+from renderer import DirtyRenderer
+from turbo import TurboControl, SPEEDS
+from parallel_eval import ParallelEvaluator
+from population_network import PopulationNetwork
+from profiling import FrameProfiler, ProfileReporter
+from checkpoint import NeatCheckpointer, restore_population, load_genome, seed_population
 
 pygame.init()
-clock = pygame.time.Clock()
 
 # Window
 win_height = 720
 win_width = 551
-window = pygame.display.set_mode((win_width, win_height))
+window = None  # opened by the first generation that is drawn, headless runs never open one
 
-# Images
-bird_images = [pygame.image.load("assets/bird_down.png"),
-               pygame.image.load("assets/bird_mid.png"),
-               pygame.image.load("assets/bird_up.png")]
-skyline_image = pygame.image.load("assets/background.png")
-ground_image = pygame.image.load("assets/ground.png")
-top_pipe_image = pygame.image.load("assets/pipe_top.png")
-bottom_pipe_image = pygame.image.load("assets/pipe_bottom.png")
+# Images, loaded by the shared asset loader the first time they are used
+bird_images = assets.AssetImages(assets.BIRD_FRAMES)
 
 # Game
 scroll_speed = 3
 bird_start_position = (100, 250)
 score = 0
 font = pygame.font.SysFont('Segoe', 26)
+generation = 0
+generations = 50  # generations a run trains for, a resumed run only for the ones that are left
+decision_interval = 1  # the networks are asked every this many frames and their decision is repeated in between
+# headless generations end after this many frames: a bird that keeps flapping above the pipes never dies, and a
+# worker process has no ESC key to stop its generation
+headless_max_frames = 36000
 
 
 class Bird(pygame.sprite.Sprite):
@@ -58,19 +69,22 @@ class Bird(pygame.sprite.Sprite):
         if self.vel == 0:
             self.flap = False
 
-        # Rotate Bird
-        self.image = pygame.transform.rotate(self.image, self.vel * -7)
+        # Rotate Bird, vel only takes 0.5 steps between -7 and 7 so every angle is rotated once and cached
+        self.image = get_rotated(self.image, self.vel * -7).surface
 
 
 class Pipe(pygame.sprite.Sprite):
     def __init__(self, x, y, image, pipe_type):
         pygame.sprite.Sprite.__init__(self)
-        self.image = image
-        self.rect = self.image.get_rect()
-        self.rect.x, self.rect.y = x, y
+        self.image_name = image  # asset name, the rect only needs the size from the file header
+        self.rect = pygame.Rect((x, y), assets.size(image))
         self.enter, self.exit, self.passed = False, False, False
         self.pipe_type = pipe_type
 
+    @property
+    def image(self):  # only loaded once the pipe is drawn
+        return assets.image(self.image_name)
+
     def update(self):
         # Move Pipe
         self.rect.x -= scroll_speed
@@ -90,11 +104,11 @@ class Pipe(pygame.sprite.Sprite):
 
 
 class Ground(pygame.sprite.Sprite):
+    image = assets.AssetImage('ground')  # only loaded once the ground is drawn
+
     def __init__(self, x, y):
         pygame.sprite.Sprite.__init__(self)
-        self.image = ground_image
-        self.rect = self.image.get_rect()
-        self.rect.x, self.rect.y = x, y
+        self.rect = pygame.Rect((x, y), assets.size('ground'))
 
     def update(self):
         # Move Ground
@@ -103,9 +117,65 @@ class Ground(pygame.sprite.Sprite):
             self.kill()
 
 
+# Advances the pipes and the ground by one frame
+def step_world(pipes, ground):
+    pipes.update()
+    ground.update()
+
+
+# Pipe the birds are flying towards: the second sprite once the birds are past the centre of the first one
+def find_nearest_pipe(pipes):
+    pipe_list = pipes.sprites()
+    nearest_pipe_ind = 0
+    if len(pipe_list) > 1:
+        if bird_start_position[0] > pipe_list[0].rect.centerx:
+            nearest_pipe_ind = 1
+    if nearest_pipe_ind < len(pipe_list):
+        return pipe_list[nearest_pipe_ind]
+    return None
+
+
+# Moves one bird and returns True if it crashed into a pipe or the ground
+def step_bird(bird, flap, pipes, ground, profiler=None):
+    if profiler is not None:
+        profiler.enter('physics')
+    if flap:
+        bird.flap_wings()
+
+    # Move Bird
+    bird.update()
+
+    if profiler is not None:
+        profiler.enter('collision')
+    collision_pipes = pygame.sprite.spritecollide(bird, pipes, False)
+    collision_ground = pygame.sprite.spritecollide(bird, ground, False)
+    return bool(collision_pipes or collision_ground)
+
+
+# Marks the bottom pipes the birds got past since the last frame and returns how many there were
+def count_passed_pipes(pipes):
+    passed = 0
+    for pipe in pipes:
+        if pipe.pipe_type == 'bottom' and bird_start_position[0] > pipe.rect.centerx and not pipe.passed:
+            pipe.passed = True
+            passed += 1
+    return passed
+
+
 # NEAT Training Function
-def eval_genomes(genomes, config):
-    global score
+# headless=True skips drawing, event handling and the fps cap; seed fixes the pipes of this world, without it
+# the generation's course is derived from course_seed.
+# decision_interval > 1 only queries the networks every that many frames, the physics still run every frame.
+# max_frames ends the generation after that many frames even if some birds are still flying and a FrameProfiler
+# passed as profiler times the phases of every frame. turbo is the TurboControl that sets the speed of a windowed
+# run, keep passing the same one so the speed picked with the keys carries over generations
+def eval_genomes(genomes, config, headless=False, seed=None, decision_interval=decision_interval, course_seed=None,
+                 max_frames=None, profiler=None, turbo=None):
+    global score, generation, window
+    generation += 1
+    if not headless and window is None:
+        window = pygame.display.set_mode((win_width, win_height))
+    course = Course(seed if seed is not None else generation_seed(course_seed, generation))
 
     birds = []
     neural_networks = []
@@ -129,121 +199,214 @@ def eval_genomes(genomes, config):
         genome.fitness = 0
 
     bird_group = pygame.sprite.Group(birds)
+    if not headless:
+        renderer = DirtyRenderer(window, assets.image('background'))  # only redraws what changed
+        if turbo is None:
+            turbo = TurboControl(60)
+        turbo.reset()
+    population_network = PopulationNetwork.create(neural_networks)  # all networks evaluated in one batched call
+
+    frame = 0
+    flaps = np.zeros(len(birds), dtype=bool)
 
     run = True
     while run:
-        # Quit
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                pygame.quit()
-                exit()
-
-        # User Input
-        user_input = pygame.key.get_pressed()
-        if user_input[pygame.K_ESCAPE]:  # Press ESC to stop the NEAT training loop
-            run = False
-
-        # Reset Frame
-        window.fill((0, 0, 0))
-
-        # Draw Background
-        window.blit(skyline_image, (0, 0))
-
+        if profiler is not None:
+            profiler.start_frame('physics')
         # Spawn Ground
         if len(ground) <= 2:
             ground.add(Ground(win_width, y_pos_ground))
 
-        # Draw - Pipes, Ground and Bird
-        pipes.draw(window)
-        ground.draw(window)
-        bird_group.draw(window)
-
-        # Show Score
-        score_text = font.render('Score: ' + str(score), True, pygame.Color(255, 255, 255))
-        window.blit(score_text, (20, 20))
-
-        for bird, net, genome in zip(birds, neural_networks, ge):
+        render = False
+        if not headless:
+            # Wait for the step at the current speed and pump the events, 1, 2, 3 and 0 switch between
+            # 1x, 10x, max and no drawing
+            turbo.tick(profiler)
+
+            # User Input
+            user_input = pygame.key.get_pressed()
+            if user_input[pygame.K_ESCAPE]:  # Press ESC to stop the NEAT training loop
+                run = False
+            render = turbo.render
+
+        if render:
+            if profiler is not None:
+                profiler.enter('drawing')
+            # Reset Frame
+            renderer.begin_frame()
+
+            # Draw - Pipes, Ground and Bird, only the best turbo.draw_top alive birds when it is set
+            pipes.draw(renderer)
+            ground.draw(renderer)
+            if turbo.draw_top is None:
+                bird_group.draw(renderer)
+            else:
+                for i in turbo.visible([bird.alive for bird in birds], [genome.fitness for genome in ge]):
+                    renderer.blit(birds[i].image, birds[i].rect)
+
+            # Show Score
+            score_text = hud.render(font, 'Score: ' + str(score), True, pygame.Color(255, 255, 255))
+            renderer.blit(score_text, (20, 20))
+
+        if profiler is not None:
+            profiler.enter('physics')
+        # World step, once per frame for all birds
+        if any(bird.alive for bird in birds):
+            step_world(pipes, ground)
+
+        # Neural Network Input: every bird flies at the same x, so the nearest pipe is looked up once per frame
+        # and the inputs of all alive birds are evaluated in one batched call, every decision_interval frames
+        if frame % decision_interval == 0:
+            if profiler is not None:
+                profiler.enter('inference')
+            alive = np.array([bird.alive for bird in birds])
+            nearest_pipe = find_nearest_pipe(pipes)
+            if nearest_pipe is not None:
+                bird_y = np.array([bird.rect.y for bird in birds])
+                input_data = np.column_stack((bird_y, np.abs(bird_y - nearest_pipe.rect.height),
+                                              np.abs(bird_y - nearest_pipe.rect.bottom)))
+                flaps = population_network.activate(input_data, alive)[:, 0] > 0.5
+            else:
+                flaps = np.zeros(len(birds), dtype=bool)  # no pipe yet, nobody flaps
+        frame += 1
+
+        # Agent step for every alive bird
+        for i, (bird, genome) in enumerate(zip(birds, ge)):
             if bird.alive:
-                pipes.update()
-                ground.update()
-
-                # Neural Network Input
-                nearest_pipe_ind = 0
-                pipe_list = pipes.sprites()
-                if len(pipe_list) > 1:
-                    if bird.rect.centerx > pipe_list[0].rect.centerx:
-                        nearest_pipe_ind = 1
-
-                if nearest_pipe_ind < len(pipe_list):
-                    input_data = (bird.rect.y, abs(bird.rect.y - pipe_list[nearest_pipe_ind].rect.height),
-                                  abs(bird.rect.y - pipe_list[nearest_pipe_ind].rect.bottom))
-                else:
-                    input_data = None
-
-                if input_data is not None:
-                    output = net.activate(input_data)
-                else:
-                    output = [0]
-
-                if output[0] > 0.5:
-                    bird.flap_wings()
-
-                # Move Bird
-                bird.update()
-
-                collision_pipes = pygame.sprite.spritecollide(bird, pipes, False)
-                collision_ground = pygame.sprite.spritecollide(bird, ground, False)
-                if collision_pipes or collision_ground:
+                if step_bird(bird, flaps[i], pipes, ground, profiler):  # repeats the last decision in between decisions
                     bird.alive = False
                     genome.fitness -= 1
 
-                # Check if the bird passed a pipe
-                for pipe in pipes:
-                    if pipe.pipe_type == 'bottom' and bird.rect.centerx > pipe.rect.centerx and not pipe.passed:
-                        pipe.passed = True
-                        genome.fitness += 5
+        if profiler is not None:
+            profiler.enter('physics')
+        # Pass detection, once per frame, shared by every bird still alive
+        passed = count_passed_pipes(pipes)
+        if passed:
+            for bird, genome in zip(birds, ge):
+                if bird.alive:
+                    genome.fitness += 5 * passed
 
         # Spawn Pipes
         if pipe_timer <= 0 and any(bird.alive for bird in birds):
             x_top, x_bottom = 550, 550
-            y_top = random.randint(-600, -480)
-            y_bottom = y_top + random.randint(110, 130) + bottom_pipe_image.get_height()
-            pipes.add(Pipe(x_top, y_top, top_pipe_image, 'top'))
-            pipes.add(Pipe(x_bottom, y_bottom, bottom_pipe_image, 'bottom'))
-            pipe_timer = random.randint(180, 250)
+            y_top, gap, pipe_timer = course.pipe_pair()
+            y_bottom = y_top + gap + assets.size('pipe_bottom')[1]
+            pipes.add(Pipe(x_top, y_top, 'pipe_top', 'top'))
+            pipes.add(Pipe(x_bottom, y_bottom, 'pipe_bottom', 'bottom'))
         pipe_timer -= 2
 
-        clock.tick(60)
-        pygame.display.update()
+        if render:
+            if profiler is not None:
+                profiler.enter('drawing')
+            renderer.end_frame()
+        if profiler is not None:
+            profiler.end_frame()
 
         # Check if all birds are dead
         if not any(bird.alive for bird in birds):
             break
+        if max_frames is not None and frame >= max_frames:
+            break
 
 
-# Run NEAT algorithm
-def run_neat(config_file):
-    # Load NEAT configuration
-    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
-                         neat.DefaultSpeciesSet, neat.DefaultStagnation, config_file)
-
-    # Create a population
-    population = neat.Population(config)
+# Runs a chunk of genomes in its own headless world inside a ParallelEvaluator worker process
+def eval_genome_chunk(genomes, config, seed, decision_interval=decision_interval, max_frames=headless_max_frames):
+    eval_genomes(genomes, config, headless=True, seed=seed, decision_interval=decision_interval,
+                 max_frames=max_frames)
+    return [genome.fitness for _, genome in genomes]
+
+
+# Run NEAT algorithm, profile prints where the frame time of every generation went. speed is the starting speed of
+# the window, render_every only draws every that many frames and draw_top only draws the best that many birds.
+# checkpoint writes a checkpoint of the population after every generation and the best genome so far into that
+# directory, resume continues the run of a checkpoint (or of the newest one in a directory) and warm_start starts
+# from mutated copies of a saved genome instead of random ones. max_frames ends every generation after that many
+# frames, by default the workers stop at headless_max_frames and the window never does. Returns the winner
+def run_neat(config_file, workers=None, decision_interval=decision_interval, course_seed=None, profile=False,
+             speed='1x', render_every=1, draw_top=None, checkpoint=None, resume=None, warm_start=None,
+             max_frames=None):
+    global generation
+    if workers and profile:
+        raise ValueError("frames can only be profiled without worker processes")
+
+    if resume:
+        # Continue a checkpointed population
+        population = restore_population(resume)
+    else:
+        # Load NEAT configuration
+        config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                             neat.DefaultSpeciesSet, neat.DefaultStagnation, config_file)
+
+        # Create a population
+        population = neat.Population(config)
+        if warm_start:
+            seed_population(population, load_genome(warm_start))
+    if population.generation >= generations:
+        raise ValueError("{0} is already at generation {1}, the run of {2} generations is over"
+                         .format(resume, population.generation, generations))
+    generation = population.generation  # the courses of a resumed run go on from where it stopped
 
     # Add a reporter to show progress in the terminal
     population.add_reporter(neat.StdOutReporter(True))
     stats = neat.StatisticsReporter()
     population.add_reporter(stats)
-
-    # Run the NEAT algorithm
-    winner = population.run(eval_genomes, 50)
+    profiler = FrameProfiler() if profile else None
+    if profiler is not None:
+        population.add_reporter(ProfileReporter(profiler))
+    checkpointer = NeatCheckpointer(checkpoint) if checkpoint else None
+    if checkpointer is not None:
+        population.add_reporter(checkpointer)
+
+    # Run the NEAT algorithm, optionally spread over worker processes
+    try:
+        if workers:
+            chunk_frames = headless_max_frames if max_frames is None else max_frames
+            evaluator = ParallelEvaluator(workers, partial(eval_genome_chunk, decision_interval=decision_interval,
+                                                           max_frames=chunk_frames),
+                                          seed=course_seed)
+            evaluator.generation = population.generation
+            winner = population.run(evaluator.evaluate, generations - population.generation)
+            evaluator.close()
+        else:
+            turbo = TurboControl(60, speed, render_every, draw_top=draw_top)
+            winner = population.run(partial(eval_genomes, decision_interval=decision_interval,
+                                            course_seed=course_seed, max_frames=max_frames, profiler=profiler,
+                                            turbo=turbo),
+                                    generations - population.generation)
+    finally:  # also on Ctrl+C, so the checkpoints written so far are complete
+        if checkpointer is not None:
+            checkpointer.close()
 
     print("Best genome:\n", winner)
+    return winner
 
 
 # Main function
 def main():
-    run_neat("config-feedforward.txt")
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=None, help='evaluate genomes in this many worker processes')
+    parser.add_argument('--decision-interval', type=int, default=decision_interval,
+                        help='ask the networks every this many frames and repeat their decision in between')
+    parser.add_argument('--course-seed', type=int, default=None, help='base seed of the pipe courses')
+    parser.add_argument('--profile', action='store_true', help='print a frame time profile of every generation')
+    parser.add_argument('--speed', choices=list(SPEEDS), default='1x',
+                        help='starting speed of the window, switch it with the keys 1, 2, 3 and 0 while it runs')
+    parser.add_argument('--render-every', type=int, default=1, help='only draw every this many frames')
+    parser.add_argument('--draw-top', type=int, default=None, help='only draw the best this many birds')
+    parser.add_argument('--checkpoint', metavar='DIR', help='checkpoint the population every generation into DIR')
+    parser.add_argument('--resume', metavar='PATH', help='continue from a checkpoint, or the newest one in a directory')
+    parser.add_argument('--warm-start', metavar='GENOME', help='start from mutated copies of a saved genome')
+    parser.add_argument('--max-frames', type=int, default=None,
+                        help='end every generation after this many frames (default {0} with workers, no limit in '
+                             'the window)'.format(headless_max_frames))
+    args = parser.parse_args()
+    if args.decision_interval < 1:
+        parser.error('--decision-interval must be at least 1')
+
+    run_neat("config-feedforward.txt", workers=args.workers, decision_interval=args.decision_interval,
+             course_seed=args.course_seed, profile=args.profile, speed=args.speed, render_every=args.render_every,
+             draw_top=args.draw_top, checkpoint=args.checkpoint, resume=args.resume, warm_start=args.warm_start,
+             max_frames=args.max_frames)
 
 
 if __name__ == "__main__":
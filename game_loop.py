@@ -0,0 +1,99 @@
+import time
+import pygame
+from sys import exit
+
+MAX_LAG = 0.25  # seconds a loop may fall behind before the missing time is dropped instead of caught up
+PUMP_INTERVAL = 1 / 60  # frames that are not drawn still pump the events at least this often
+
+
+# Fixed timestep loop shared by the games and the windowed training runs. Every pass of a game loop is one physics
+# step of 1 / fps seconds; tick() is called at the start of it and
+#   - waits until the step is due: the wall time since the last step goes into an accumulator and every step takes
+#     1 / fps out of it, so slow frames are caught up with steps that are not drawn instead of slowing the game down
+#   - decides whether the step is drawn (loop.render): not while steps are being caught up, only every
+#     render_every steps and at most render_fps times a second when it is set
+#   - pumps the events once, quits on the close button and returns the other events to the game
+# fps=None never waits, the step runs as fast as the cpu allows (headless benchmarks, turbo training).
+class GameLoop:
+    def __init__(self, fps=60, render_fps=None, render_every=1):
+        self.fps = fps
+        self.render_fps = render_fps
+        self.render_every = render_every
+        self.render = True  # whether the step tick() just started is drawn
+        self.reset()
+
+    # starts counting steps and time anew, e.g. when a new game or generation starts
+    def reset(self):
+        self.frame = 0
+        self.accumulator = 0.0
+        self.last_time = None
+        self.last_render = None
+        self.last_pump = None
+
+    def set_fps(self, fps):
+        self.fps = fps
+        self.accumulator = 0.0
+        self.last_time = None
+
+    # the one event pump of a frame
+    def pump(self):
+        self.last_pump = time.perf_counter()
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:  # the red cross button quits the game
+                pygame.quit()
+                exit()
+        return events
+
+    def tick(self, profiler=None):
+        behind = False
+        now = time.perf_counter()
+        if self.fps:
+            step = 1 / self.fps
+            if self.last_time is None:
+                self.accumulator = step  # the first step is due right away
+            else:
+                self.accumulator += now - self.last_time
+            if self.accumulator < step:
+                if profiler is not None:
+                    profiler.enter('wait')
+                time.sleep(step - self.accumulator)
+                later = time.perf_counter()
+                self.accumulator += later - now
+                now = later
+            self.last_time = now
+            self.accumulator = min(self.accumulator - step, MAX_LAG)
+            behind = self.accumulator >= step  # the next step is due already, so this one is not drawn
+
+        overdue = self.last_render is None or now - self.last_render >= MAX_LAG  # a loop that is always behind
+        self.render = (self.frame % self.render_every == 0 and (not behind or overdue) and
+                       (self.render_fps is None or overdue or now - self.last_render >= 1 / self.render_fps))
+        if self.render:
+            self.last_render = now
+        self.frame += 1
+
+        events = []
+        if self.render or self.last_pump is None or now - self.last_pump >= PUMP_INTERVAL:
+            if profiler is not None:
+                profiler.enter('events')
+            events = self.pump()
+        return events
+
+
+# blocks until one of keys (any key when None) is pressed and returns it, the menus and game over screens wait here
+# instead of spinning a loop. After timeout seconds without a key press it returns None
+def wait_for_key(keys=None, timeout=None):
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    while True:
+        if deadline is None:
+            event = pygame.event.wait()
+        else:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            event = pygame.event.wait(int(remaining * 1000) + 1)
+        if event.type == pygame.QUIT:
+            pygame.quit()
+            exit()
+        if event.type == pygame.KEYDOWN and (keys is None or event.key in keys):
+            return event.key
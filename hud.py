@@ -0,0 +1,26 @@
+import pygame
+import threading
+from collections import OrderedDict
+
+# Rendering text with a font is slow compared to blitting it, and the score and alive labels are drawn every frame
+# while their values only change a few times a second. render() keeps the surfaces of the last CACHE_SIZE labels,
+# keyed by font, text, antialias and colour, so a label is only rendered again after its text changed
+CACHE_SIZE = 64
+_texts = OrderedDict()  # least recently drawn label first
+_lock = threading.Lock()  # labels are also drawn by the clip render thread of bird_ai.BestGenomeVideo
+
+
+def render(font, text, antialias, color):  # same arguments and result as font.render(text, antialias, color)
+    key = (font, text, bool(antialias), tuple(color))
+    with _lock:
+        surface = _texts.get(key)
+        if surface is None:
+            surface = font.render(text, antialias, color)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()  # in the display format the label blits without a conversion
+            _texts[key] = surface
+            if len(_texts) > CACHE_SIZE:
+                _texts.popitem(last=False)
+        else:
+            _texts.move_to_end(key)
+        return surface
@@ -1,28 +1,33 @@
+import os
 import pygame
-import random
+import assets
+import hud
+import argparse
 import numpy as np
+from functools import partial
+from course import Course, generation_seed
+from numpy_mlp import NumpyMLP
+from dqn_learner import Learner, load_checkpoint, CHECKPOINT
+from checkpoint import CheckpointWriter
+from vec_env import FlappyVecEnv
+from rollout_workers import SharedVecEnv
+from sprite_cache import get_rotated
+from renderer import DirtyRenderer
+from game_loop import GameLoop, wait_for_key
+from profiling import FrameProfiler, format_summary
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense
 from tensorflow.keras.optimizers import Adam
 
 pygame.init()
-clock = pygame.time.Clock()
 
 # Window
 win_height = 720
 win_width = 551
 window = pygame.display.set_mode((win_width, win_height))
 
-# Images
-bird_images = [pygame.image.load("assets/bird_down.png"),
-               pygame.image.load("assets/bird_mid.png"),
-               pygame.image.load("assets/bird_up.png")]
-skyline_image = pygame.image.load("assets/background.png")
-ground_image = pygame.image.load("assets/ground.png")
-top_pipe_image = pygame.image.load("assets/pipe_top.png")
-bottom_pipe_image = pygame.image.load("assets/pipe_bottom.png")
-game_over_image = pygame.image.load("assets/game_over.png")
-start_image = pygame.image.load("assets/start.png")
+# Images, loaded by the shared asset loader the first time they are used
+bird_images = assets.AssetImages(assets.BIRD_FRAMES)
 
 # Game
 scroll_speed = 1
@@ -30,6 +35,15 @@ bird_start_position = (100, 250)
 score = 0
 font = pygame.font.SysFont('Segoe', 26)
 game_stopped = True
+decision_interval = 1  # the model is asked every this many frames and its action is repeated in between
+course_seed = None  # base seed of the pipe courses, every episode gets its own course derived from it
+profiler = None  # FrameProfiler that times the phases of every frame, set by --profile
+replay_size = 50000  # transitions the replay memory keeps
+batch_size = 64  # transitions per minibatch update
+train_every = 4  # the model is trained on a minibatch every this many transitions
+target_sync = 100  # the target network takes over the model's weights every this many minibatch updates
+publish_every = 1  # the learner hands its weights to the game every this many minibatch updates
+checkpoint_every = 50  # episodes (steps of all games when training on workers: 1000 times that) between checkpoints
 
 # Create the Q-learning model
 model = Sequential()
@@ -37,6 +51,7 @@ model.add(Dense(32, input_shape=(4,), activation='relu'))
 model.add(Dense(32, activation='relu'))
 model.add(Dense(2, activation='linear'))
 model.compile(loss='mse', optimizer=Adam())
+numpy_model = NumpyMLP(model)  # the game's copy of the model that chooses the actions, Keras only trains
 
 # Function to preprocess the game state
 def preprocess_state(bird, pipes):
@@ -65,16 +80,8 @@ def choose_action(state, epsilon):
         return np.random.randint(2)
     else:
         # Choose the action with the highest Q-value (exploitation)
-        q_values = model.predict(np.array([state]))[0]
+        q_values = numpy_model.predict(np.array([state]))[0]
         return np.argmax(q_values)
-    
-# Function to update the Q-values based on the Bellman equation
-def update_q_values(states, actions, rewards, next_states, dones, gamma):
-    targets = rewards + gamma * np.max(model.predict(next_states), axis=1) * (1 - dones)
-    q_values = model.predict(states)
-    for i in range(len(actions)):
-        q_values[i][actions[i]] = targets[i]
-    model.fit(states, q_values, verbose=0)
 
 class Bird(pygame.sprite.Sprite):
     def __init__(self):
@@ -104,8 +111,8 @@ class Bird(pygame.sprite.Sprite):
         if self.vel == 0:
             self.flap = False
 
-        # Rotate Bird
-        self.image = pygame.transform.rotate(self.image, self.vel * -7)
+        # Rotate Bird, vel only takes 0.5 steps between -7 and 7 so every angle is rotated once and cached
+        self.image = get_rotated(self.image, self.vel * -7).surface
 
         # User Input
         if user_input[pygame.K_SPACE] and not self.flap and self.rect.y > 0 and self.alive:
@@ -115,12 +122,15 @@ class Bird(pygame.sprite.Sprite):
 class Pipe(pygame.sprite.Sprite):
     def __init__(self, x, y, image, pipe_type):
         pygame.sprite.Sprite.__init__(self)
-        self.image = image
-        self.rect = self.image.get_rect()
-        self.rect.x, self.rect.y = x, y
+        self.image_name = image  # asset name, the rect only needs the size from the file header
+        self.rect = pygame.Rect((x, y), assets.size(image))
         self.enter, self.exit, self.passed = False, False, False
         self.pipe_type = pipe_type
 
+    @property
+    def image(self):  # only loaded once the pipe is drawn
+        return assets.image(self.image_name)
+
     def update(self):
         # Move Pipe
         self.rect.x -= scroll_speed
@@ -139,11 +149,11 @@ class Pipe(pygame.sprite.Sprite):
                 score += 1
 
 class Ground(pygame.sprite.Sprite):
+    image = assets.AssetImage('ground')  # only loaded once the ground is drawn
+
     def __init__(self, x, y):
         pygame.sprite.Sprite.__init__(self)
-        self.image = ground_image
-        self.rect = self.image.get_rect()
-        self.rect.x, self.rect.y = x, y
+        self.rect = pygame.Rect((x, y), assets.size('ground'))
 
     def update(self):
         # Move Ground
@@ -151,32 +161,51 @@ class Ground(pygame.sprite.Sprite):
         if self.rect.x <= -win_width:
             self.kill()
 
-def quit_game():
-    # Exit Game
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            exit()
+# Puts a new learner into the state of a checkpoint (resume) or only gives the model the weights of one
+# (warm_start), both a checkpoint file or a checkpoint directory. Returns what the game saved along with the learner
+def restore(learner, resume=None, warm_start=None):
+    if resume:
+        saved = load_checkpoint(resume)
+        learner.load_state(saved.pop('learner'))
+        np.random.set_state(saved['numpy_random'])  # epsilon greedy exploration
+        return saved
+    if warm_start:
+        learner.load_weights(load_checkpoint(warm_start)['learner']['weights'])
+    return {}
 
 # Game Main Method
-def main():
+# headless=True trains without drawing, event handling or the fps cap; max_episodes and max_steps
+# bound the number of episodes and the steps per episode. With a profiler the frame time profile of
+# every episode is printed. The game only plays and hands its transitions to a Learner (dqn_learner.py), which
+# trains the model on its own thread (threaded=False trains in the game loop, for repeatable runs) and publishes
+# the new weights back every publish_every updates. checkpoint saves the model, its optimizer, the replay memory and
+# the exploration rate into that directory every checkpoint_every episodes (on background threads), resume continues
+# from such a checkpoint and warm_start only starts from the model weights of one
+def main(decision_interval=decision_interval, headless=False, max_episodes=1000, max_steps=1000, profiler=None,
+         threaded=True, checkpoint=None, resume=None, warm_start=None):
     global score
     
     # Instantiate Bird
     bird = Bird()
+    learner = Learner(model, 4, replay_size, batch_size, train_every, target_sync, publish_every, seed=course_seed,
+                      threaded=threaded)
+    saved = restore(learner, resume, warm_start)
+    checkpoints = CheckpointWriter() if checkpoint else None
     
-    epsilon = 1.0  # Exploration rate
+    epsilon = saved.get('epsilon', 1.0)  # Exploration rate
     epsilon_decay = 0.999  # Decay rate for exploration rate
     epsilon_min = 0.01  # Minimum exploration rate
     gamma = 0.99  # Discount factor for future rewards
-    max_episodes = 1000  # Maximum number of episodes
-    max_steps = 1000  # Maximum number of steps per episode
+    if not headless:
+        renderer = DirtyRenderer(window, assets.image('background'))  # only redraws what changed
+        loop = GameLoop(60)
     
     run = True
-    for episode in range(max_episodes):
+    for episode in range(saved.get('episode', 0), max_episodes):
         # Setup Pipes
         pipe_timer = 0
         pipes = pygame.sprite.Group()
+        course = Course(generation_seed(course_seed, episode))
 
         # Instantiate Initial Ground
         x_pos_ground, y_pos_ground = 0, 520
@@ -188,43 +217,52 @@ def main():
         bird.rect.center = bird_start_position
         bird.vel = 0
         score = 0
+        frames = 0  # frames of the current action not handed to the learner yet
 
         for step in range(max_steps):
-            # Quit...
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    exit()
-
-            # Reset Frame
-            window.fill((0, 0, 0))
-
-            # User Input
-            user_input = pygame.key.get_pressed()
-
-            # Draw Background
-            window.blit(skyline_image, (0, 0))
-
+            if profiler is not None:
+                profiler.start_frame('events')
+            if not headless:
+                # Wait for the next step and pump the events...
+                loop.tick(profiler)
+
+            if profiler is not None:
+                profiler.enter('physics')
             # Spawn Ground
             if len(ground) <= 2:
                 ground.add(Ground(win_width, y_pos_ground))
 
-            # Draw - Pipes, Ground, and Bird
-            pipes.draw(window)
-            ground.draw(window)
-            window.blit(bird.image, bird.rect)
-
-            # Show Score
-            score_text = font.render('Score: ' + str(score), True, pygame.Color(255, 255, 255))
-            window.blit(score_text, (20, 20))
-
-            # Choose an action...
-            state = preprocess_state(bird, pipes)
-            action = choose_action(state, epsilon)
-
-            # Take the action and observe the next state and reward...
-            if action == 0:
-                bird.flap = True
+            if not headless and loop.render:
+                if profiler is not None:
+                    profiler.enter('drawing')
+                # Reset Frame
+                renderer.begin_frame()
+
+                # Draw - Pipes, Ground, and Bird
+                pipes.draw(renderer)
+                ground.draw(renderer)
+                renderer.blit(bird.image, bird.rect)
+
+                # Show Score
+                score_text = hud.render(font, 'Score: ' + str(score), True, pygame.Color(255, 255, 255))
+                renderer.blit(score_text, (20, 20))
+
+            # Choose an action every decision_interval frames, in between the last action is repeated
+            # and the rewards of the skipped frames are added up (discounted) into one transition
+            if step % decision_interval == 0:
+                if profiler is not None:
+                    profiler.enter('inference')
+                state = preprocess_state(bird, pipes)
+                numpy_model.weights = learner.weights  # play with the latest published weights
+                action = choose_action(state, epsilon)
+                reward = 0
+                frames = 0
+
+            if profiler is not None:
+                profiler.enter('physics')
+            # Take the action and observe the next state and reward: action 1 presses SPACE, action 0 does nothing,
+            # like in FlappyVecEnv, so both training modes read the Q-values of a model the same way
+            user_input = {pygame.K_SPACE: action == 1}
 
             # Update - Pipes, Ground, and Bird
             if bird.alive:
@@ -232,72 +270,172 @@ def main():
                 ground.update()
             bird.update(user_input)
 
+            if profiler is not None:
+                profiler.enter('collision')
             # Collision Detection
             collision_pipes = pygame.sprite.spritecollide(bird, pipes, False)
             collision_ground = pygame.sprite.spritecollide(bird, ground, False)
             if collision_pipes or collision_ground:
                 bird.alive = False
                 if collision_ground:
-                    window.blit(game_over_image, (win_width // 2 - game_over_image.get_width() // 2,
-                                                win_height // 2 - game_over_image.get_height() // 2))
-                    if user_input[pygame.K_r]:
-                        score = 0
-                        break
+                    if not headless and loop.render:
+                        game_over_image = assets.image('game_over')
+                        renderer.blit(game_over_image, (win_width // 2 - game_over_image.get_width() // 2,
+                                                      win_height // 2 - game_over_image.get_height() // 2))
+                # the episode ends below once the crash is handed to the learner, the next one starts right away
 
             # Show Score
 
+            if profiler is not None:
+                profiler.enter('physics')
             # Preprocess the next state...
             next_state = preprocess_state(bird, pipes)
 
             # Determine the reward...
-            reward = 1 if bird.alive else -1
+            reward += gamma ** frames * (1 if bird.alive else -1)
+            frames += 1
 
             # Determine if the episode is done...
             done = not bird.alive
 
-            # Update the Q-values...
-            update_q_values(np.array([state]), np.array([action]), np.array([reward]), np.array([next_state]), np.array([done]), gamma)
+            # Hand the transition to the learner once the action has been repeated for the whole interval...
+            if done or frames == decision_interval:
+                if profiler is not None:
+                    profiler.enter('learning')
+                learner.push(state, action, reward, next_state, done, gamma ** frames)
+                frames = 0
+                if profiler is not None:
+                    profiler.enter('physics')
 
             # Spawn Pipes
             if pipe_timer <= 0 and bird.alive:
                 x_top, x_bottom = 550, 550
-                y_top = random.randint(-600, -480)
-                y_bottom = y_top + random.randint(90, 130) + bottom_pipe_image.get_height()
-                pipes.add(Pipe(x_top, y_top, top_pipe_image, 'top'))
-                pipes.add(Pipe(x_bottom, y_bottom, bottom_pipe_image, 'bottom'))
-                pipe_timer = random.randint(180, 250)
+                y_top, gap, pipe_timer = course.pipe_pair(gap_range=(90, 130))
+                y_bottom = y_top + gap + assets.size('pipe_bottom')[1]
+                pipes.add(Pipe(x_top, y_top, 'pipe_top', 'top'))
+                pipes.add(Pipe(x_bottom, y_bottom, 'pipe_bottom', 'bottom'))
             pipe_timer -= 1
 
-            clock.tick(60)
-            pygame.display.update()
+            if not headless and loop.render:
+                if profiler is not None:
+                    profiler.enter('drawing')
+                renderer.end_frame()
+            if profiler is not None:
+                profiler.end_frame()
 
             if done:
                 break
 
+        # max_steps cut the last action short, its transition covers the frames it was repeated for
+        if frames:
+            learner.push(state, action, reward, next_state, False, gamma ** frames)
+
+        if profiler is not None:
+            print(format_summary(profiler.end_generation(episode), name='episode'))
+
         # Decay the exploration rate...
         epsilon *= epsilon_decay
         epsilon = max(epsilon, epsilon_min)
 
-# Menu
-def menu():
+        # Checkpoint the training...
+        if checkpoints is not None and ((episode + 1) % checkpoint_every == 0 or episode + 1 == max_episodes):
+            learner.save(checkpoints, os.path.join(checkpoint, CHECKPOINT), episode=episode + 1, epsilon=epsilon,
+                         numpy_random=np.random.get_state())
+
+    learner.close()
+    if checkpoints is not None:
+        checkpoints.close()
+
+# Headless training on num_workers processes that each play envs_per_worker games of vec_env.FlappyVecEnv set up
+# like this game (scroll speed 1, gaps of 90 to 130, pipe timer step 1). Every step the actions of all games come
+# from one batched forward pass and all their transitions go to the learner together. The games flap on action 1
+# like main() and the other flappy games; every finished game counts as an episode for the exploration decay. checkpoint,
+# resume and warm_start work like in main(), the games of a resumed run start anew
+def train_parallel(num_workers, envs_per_worker=16, max_steps=10000, threaded=True, train_every=train_every,
+                   report_every=1000, checkpoint=None, resume=None, warm_start=None):
+    make_env = partial(FlappyVecEnv, envs_per_worker, scroll_speed=scroll_speed, gap_range=(90, 130), timer_step=1)
+    envs = SharedVecEnv(make_env, num_workers, envs_per_worker, 4, seed=course_seed)
+    learner = Learner(model, 4, replay_size, batch_size, train_every, target_sync, publish_every, seed=course_seed,
+                      threaded=threaded)
+    saved = restore(learner, resume, warm_start)
+    checkpoints = CheckpointWriter() if checkpoint else None
+
+    epsilon = saved.get('epsilon', 1.0)  # Exploration rate
+    epsilon_decay = 0.999  # Decay rate for exploration rate, per finished game
+    epsilon_min = 0.01  # Minimum exploration rate
+    gamma = 0.99  # Discount factor for future rewards
+    episodes = saved.get('episodes', 0)
+    best_score = saved.get('best_score', 0)
+    try:
+        states = envs.reset()
+        for step in range(saved.get('step', 0), max_steps):
+            # Choose the actions of all games at once, exploring in some of them
+            numpy_model.weights = learner.weights
+            actions = np.argmax(numpy_model.predict(states), axis=1)
+            explore = np.random.rand(envs.num_envs) < epsilon
+            actions[explore] = np.random.randint(2, size=np.count_nonzero(explore))
+
+            next_states, rewards, dones, info = envs.step(actions)
+            learner.push_batch(states, actions, rewards, next_states, dones, gamma)
+            states = next_states  # finished games already started again, their next state is not used
+
+            finished = np.count_nonzero(dones)
+            if finished:
+                episodes += finished
+                best_score = max(best_score, info['score'][dones].max())
+                epsilon = max(epsilon * epsilon_decay ** finished, epsilon_min)
+            if (step + 1) % report_every == 0:
+                print("step {0}: {1} games played, best score {2}, epsilon {3:.3f}".format(
+                    step + 1, episodes, best_score, epsilon))
+            if checkpoints is not None and ((step + 1) % (checkpoint_every * 1000) == 0 or step + 1 == max_steps):
+                learner.save(checkpoints, os.path.join(checkpoint, CHECKPOINT), step=step + 1, episodes=episodes,
+                             best_score=best_score, epsilon=epsilon, numpy_random=np.random.get_state())
+    finally:
+        envs.close()
+    learner.close()
+    if checkpoints is not None:
+        checkpoints.close()
+
+# Menu, training is the decision_interval, checkpoint, resume and warm_start arguments of main()
+def menu(**training):
     global game_stopped
 
     while game_stopped:
-        quit_game()
-
         # Draw Menu
         window.fill((0, 0, 0))
-        window.blit(skyline_image, (0, 0))
-        window.blit(ground_image, Ground(0, 520))
+        window.blit(assets.image('background'), (0, 0))
+        window.blit(assets.image('ground'), Ground(0, 520))
         window.blit(bird_images[0], (100, 250))
+        start_image = assets.image('start')
         window.blit(start_image, (win_width // 2 - start_image.get_width() // 2,
                                   win_height // 2 - start_image.get_height() // 2))
 
-        # User Input
-        user_input = pygame.key.get_pressed()
-        if user_input[pygame.K_SPACE]:
-            main()
-
         pygame.display.update()
 
-menu()
+        # User Input, the menu does not change so it blocks until SPACE is pressed
+        wait_for_key((pygame.K_SPACE,))
+        main(profiler=profiler, **training)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store_true', help='print a frame time profile of every episode')
+    parser.add_argument('--decision-interval', type=int, default=decision_interval,
+                        help='ask the model every this many frames and repeat its action in between')
+    parser.add_argument('--workers', type=int, help='train headless on this many worker processes instead')
+    parser.add_argument('--envs-per-worker', type=int, default=16, help='games every worker process plays')
+    parser.add_argument('--steps', type=int, default=10000, help='steps of all games when training on workers')
+    parser.add_argument('--checkpoint', metavar='DIR', help='checkpoint the training into DIR')
+    parser.add_argument('--resume', metavar='PATH', help='continue from a checkpoint file or directory')
+    parser.add_argument('--warm-start', metavar='PATH', help='start from the model weights of a checkpoint')
+    args = parser.parse_args()
+    if args.decision_interval < 1:
+        parser.error('--decision-interval must be at least 1')
+    if args.profile:
+        profiler = FrameProfiler()
+    training = dict(checkpoint=args.checkpoint, resume=args.resume, warm_start=args.warm_start)
+    if args.workers:
+        if args.decision_interval != 1:
+            parser.error('--decision-interval only applies to the windowed game, not to --workers')
+        train_parallel(args.workers, args.envs_per_worker, args.steps, **training)
+    else:
+        menu(decision_interval=args.decision_interval, **training)
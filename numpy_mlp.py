@@ -0,0 +1,38 @@
+import numpy as np
+
+# NumPy versions of the Keras activations a Dense layer can use here
+ACTIVATIONS = {
+    'linear': lambda z: z,
+    'relu': lambda z: np.maximum(z, 0.0),
+    'sigmoid': lambda z: 1.0 / (1.0 + np.exp(-z)),
+    'tanh': np.tanh,
+}
+
+
+# NumPy copy of a Keras Sequential model made of Dense layers, for the small batches the DQN asks its network about
+# every frame: a forward pass of the 4-32-32-2 network is a few microseconds in NumPy while every Keras call costs
+# a fixed setup far larger than that. The copy only sees new weights when sync() copies them over from the model,
+# so the model is synced after it was trained
+class NumpyMLP:
+    def __init__(self, model):
+        self.model = model
+        self.activations = []
+        for layer in model.layers:
+            activation = layer.get_config().get('activation')
+            if activation not in ACTIVATIONS:
+                raise ValueError("layer {0} has activation {1!r}, NumpyMLP only supports Dense layers with {2}"
+                                 .format(layer.name, activation, ', '.join(ACTIVATIONS)))
+            self.activations.append(ACTIVATIONS[activation])
+        self.weights = []  # (kernel, bias) per layer
+        self.sync()
+
+    def sync(self):
+        weights = self.model.get_weights()
+        self.weights = list(zip(weights[0::2], weights[1::2]))
+
+    # the model's outputs for a batch of inputs, like model.predict_on_batch(inputs)
+    def predict(self, inputs):
+        values = np.asarray(inputs, dtype=np.float32)
+        for (kernel, bias), activation in zip(self.weights, self.activations):
+            values = activation(values @ kernel + bias)
+        return values
@@ -0,0 +1,47 @@
+import multiprocessing
+from course import generation_seed
+
+
+# Same usage as neat.ParallelEvaluator (population.run(evaluator.evaluate, n)), but instead of one genome per task
+# each worker process gets a chunk of genomes and runs them together in its own headless world.
+# eval_function(genomes, config, seed) must return the fitness of every genome of the chunk in order; all chunks of
+# a generation get the same pipe seed so the fitness of birds from different worlds stays comparable.
+# fixed_seed flies every generation on that one course instead, and a fitness_cache.FitnessCache passed as cache
+# only sends the genomes to the workers that did not fly the generation's course before
+class ParallelEvaluator:
+    def __init__(self, num_workers, eval_function, chunk_size=None, timeout=None, seed=None, fixed_seed=None,
+                 cache=None):
+        self.num_workers = num_workers
+        self.eval_function = eval_function
+        self.chunk_size = chunk_size  # None splits the population evenly over the workers, 1 gives every genome its own world
+        self.timeout = timeout
+        self.seed = seed  # base course seed, None draws a fresh one every generation
+        self.fixed_seed = fixed_seed
+        self.cache = cache
+        self.generation = 0
+        self.pool = multiprocessing.Pool(num_workers)
+
+    def close(self):  # lets the workers finish and waits for them, call it once training is done
+        self.pool.close()
+        self.pool.join()
+
+    def __del__(self):
+        # joining the pool while the interpreter shuts down can hang, so left over workers are just stopped
+        self.pool.terminate()
+
+    def evaluate(self, genomes, config):
+        self.generation += 1
+        seed = self.fixed_seed
+        if seed is None:
+            seed = generation_seed(self.seed, self.generation)  # shared pipe seed for this generation
+        if self.cache is not None:
+            genomes = self.cache.lookup(genomes, seed)  # the others got their fitness from the cache
+        chunk_size = self.chunk_size or max(1, -(-len(genomes) // self.num_workers))
+        chunks = [genomes[i:i + chunk_size] for i in range(0, len(genomes), chunk_size)]
+
+        jobs = [self.pool.apply_async(self.eval_function, (chunk, config, seed)) for chunk in chunks]
+        for chunk, job in zip(chunks, jobs):
+            for (_, genome), fitness in zip(chunk, job.get(timeout=self.timeout)):
+                genome.fitness = fitness
+        if self.cache is not None:
+            self.cache.store(genomes, seed)
@@ -0,0 +1,112 @@
+import numpy as np
+from neat import activations, aggregations
+
+# NumPy versions of the neat activation functions, with the same clamping as neat.activations
+ACTIVATIONS = {
+    activations.sigmoid_activation: lambda z: 1.0 / (1.0 + np.exp(-np.clip(5.0 * z, -60.0, 60.0))),
+    activations.tanh_activation: lambda z: np.tanh(np.clip(2.5 * z, -60.0, 60.0)),
+    activations.sin_activation: lambda z: np.sin(np.clip(5.0 * z, -60.0, 60.0)),
+    activations.gauss_activation: lambda z: np.exp(-5.0 * np.clip(z, -3.4, 3.4) ** 2),
+    activations.relu_activation: lambda z: np.maximum(z, 0.0),
+    activations.identity_activation: lambda z: z,
+    activations.clamped_activation: lambda z: np.clip(z, -1.0, 1.0),
+    activations.abs_activation: np.abs,
+    activations.hat_activation: lambda z: np.maximum(0.0, 1 - np.abs(z)),
+    activations.square_activation: lambda z: z ** 2,
+    activations.cube_activation: lambda z: z ** 3,
+}
+
+
+# All FeedForwardNetworks of a generation packed into padded NumPy tensors, one set per layer, so the
+# whole population is evaluated with a few array operations per layer instead of a graph walk per genome.
+# Every network gets a row of value slots: its inputs first, then one slot per node, then a slot that always
+# stays zero (outputs that are not connected) and a scratch slot that the padding of smaller layers writes to.
+class PopulationNetwork:
+    def __init__(self, num_inputs, layers, output_slots, num_slots):
+        self.num_inputs = num_inputs
+        self.layers = layers  # list of (weights, bias, response, activation, slots) per layer
+        self.output_slots = output_slots
+        self.num_slots = num_slots
+
+    @staticmethod
+    def create(networks):
+        num_inputs = len(networks[0].input_nodes)
+        num_nodes = max(len(net.node_evals) for net in networks)
+        zero_slot = num_inputs + num_nodes
+        scratch_slot = zero_slot + 1
+        num_slots = scratch_slot + 1
+        activation_functions = list(ACTIVATIONS)
+
+        # place every node of every network in the layer after the deepest node it reads from
+        depths = []
+        node_slots = []
+        for net in networks:
+            slot = {key: i for i, key in enumerate(net.input_nodes)}
+            depth = {key: 0 for key in net.input_nodes}
+            for node, act_func, agg_func, bias, response, links in net.node_evals:
+                if act_func not in ACTIVATIONS or agg_func is not aggregations.sum_aggregation:
+                    raise ValueError("node {0} uses an activation or aggregation PopulationNetwork "
+                                     "does not support".format(node))
+                slot[node] = num_inputs + len(slot) - len(net.input_nodes)
+                depth[node] = 1 + max((depth[i] for i, w in links), default=0)
+            depths.append(depth)
+            node_slots.append(slot)
+
+        num_layers = max((max(depth.values()) for depth in depths), default=0)
+        layers = []
+        for layer in range(1, num_layers + 1):
+            layer_nodes = [[node_eval for node_eval in net.node_evals if depths[p][node_eval[0]] == layer]
+                           for p, net in enumerate(networks)]
+            width = max(len(nodes) for nodes in layer_nodes)
+            weights = np.zeros((len(networks), width, num_slots))
+            bias = np.zeros((len(networks), width))
+            response = np.zeros((len(networks), width))
+            activation = np.zeros((len(networks), width), dtype=int)
+            slots = np.full((len(networks), width), scratch_slot)
+            real = np.zeros((len(networks), width), dtype=bool)  # False for the padding of smaller layers
+
+            for p, nodes in enumerate(layer_nodes):
+                for k, (node, act_func, agg_func, node_bias, node_response, links) in enumerate(nodes):
+                    for i, w in links:
+                        weights[p, k, node_slots[p][i]] += w
+                    bias[p, k] = node_bias
+                    response[p, k] = node_response
+                    activation[p, k] = activation_functions.index(act_func)
+                    slots[p, k] = node_slots[p][node]
+                    real[p, k] = True
+            used = np.unique(activation[real])
+            if len(used) == 1:  # the usual case: one activation function for the whole layer, padding included
+                activation = int(used[0])
+            layers.append((weights, bias, response, activation, slots))
+
+        output_slots = np.array([[node_slots[p].get(key, zero_slot) for key in net.output_nodes]
+                                 for p, net in enumerate(networks)])
+        return PopulationNetwork(num_inputs, layers, output_slots, num_slots)
+
+    # inputs has one row of observations per network; with alive given only those rows are evaluated
+    # and the outputs of the other networks are left at zero
+    def activate(self, inputs, alive=None):
+        rows = slice(None) if alive is None else np.flatnonzero(alive)
+        outputs = np.zeros(self.output_slots.shape)
+        count = len(outputs) if alive is None else len(rows)
+        if count == 0:
+            return outputs
+
+        values = np.zeros((count, self.num_slots))
+        values[:, :self.num_inputs] = np.asarray(inputs, dtype=float)[rows]
+        activation_functions = list(ACTIVATIONS.values())
+        network_index = np.arange(count)[:, None]
+        for weights, bias, response, activation, slots in self.layers:
+            z = bias[rows] + response[rows] * np.matmul(weights[rows], values[:, :, None])[:, :, 0]
+            if isinstance(activation, int):
+                out = activation_functions[activation](z)
+            else:
+                activation = activation[rows]
+                out = np.empty_like(z)
+                for a in np.unique(activation):
+                    used = activation == a
+                    out[used] = activation_functions[a](z[used])
+            values[network_index, slots[rows]] = out
+
+        outputs[rows] = np.take_along_axis(values, self.output_slots[rows], axis=1)
+        return outputs
@@ -0,0 +1,115 @@
+import time
+import numpy as np
+from neat.reporting import BaseReporter
+
+# per-frame times are sorted into log spaced bins from 1 microsecond to 1 second, three bins per decade
+HISTOGRAM_BINS = np.logspace(-6, 0, 19)
+SPARK_CHARS = ' ▁▂▃▄▅▆▇█'
+
+
+# Splits the time of every frame over named phases (events, inference, physics, collision, drawing, wait, ...).
+# The game loops call enter(phase) where a phase starts and the time up to the next enter() or end_frame()
+# is booked to it. The loops only call it when they were given a profiler, so without one nothing is measured.
+class FrameProfiler:
+    def __init__(self, bins=HISTOGRAM_BINS):
+        self.bins = bins
+        self.phase = None
+        self.phase_start = 0.0
+        self.frame = {}  # seconds per phase of the current frame
+        self.frames = {}  # per phase, the seconds of every frame of the current generation that ran it
+        self.frame_totals = []
+        self.history = []  # summary of every finished generation
+
+    def start_frame(self, phase='other'):
+        self.frame = {}
+        self.phase = phase
+        self.phase_start = time.perf_counter()
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        self.frame[self.phase] = self.frame.get(self.phase, 0.0) + now - self.phase_start
+        self.phase = phase
+        self.phase_start = now
+
+    def end_frame(self):
+        self.enter(None)
+        for phase, seconds in self.frame.items():
+            if phase is not None:
+                self.frames.setdefault(phase, []).append(seconds)
+        self.frame_totals.append(sum(self.frame.values()))
+
+    def histogram(self, seconds):
+        return np.histogram(np.clip(seconds, self.bins[0], self.bins[-1]), self.bins)[0]
+
+    # closes the current generation (or episode) and returns its summary: time per phase, share of the frame
+    # time, mean/p50/p99/max per frame and a histogram of the per-frame times
+    def end_generation(self, generation=None):
+        frame_totals = np.array(self.frame_totals)
+        total = frame_totals.sum()
+        phases = {}
+        for phase, seconds in self.frames.items():
+            seconds = np.array(seconds)
+            phases[phase] = {
+                'frames': len(seconds),
+                'seconds': float(seconds.sum()),
+                'share': float(seconds.sum() / total) if total else 0.0,
+                'mean': float(seconds.mean()),
+                'p50': float(np.percentile(seconds, 50)),
+                'p99': float(np.percentile(seconds, 99)),
+                'max': float(seconds.max()),
+                'histogram': self.histogram(seconds).tolist(),
+            }
+        summary = {
+            'generation': generation,
+            'frames': len(frame_totals),
+            'seconds': float(total),
+            'frame_histogram': self.histogram(frame_totals).tolist() if len(frame_totals) else [],
+            'phases': phases,
+        }
+        self.history.append(summary)
+        self.frames = {}
+        self.frame_totals = []
+        return summary
+
+
+def format_duration(seconds):
+    if seconds >= 1:
+        return "{0:.2f}s".format(seconds)
+    if seconds >= 1e-3:
+        return "{0:.2f}ms".format(seconds * 1e3)
+    return "{0:.0f}us".format(seconds * 1e6)
+
+
+def sparkline(counts):
+    if not counts or max(counts) == 0:
+        return ''
+    top = max(counts)
+    return ''.join(SPARK_CHARS[-(-count * (len(SPARK_CHARS) - 1) // top)] for count in counts)
+
+
+# human readable table of an end_generation() summary
+def format_summary(summary, name='generation'):
+    frames = summary['frames']
+    lines = ["profile of {0} {1}: {2} frames in {3} ({4} per frame)".format(
+        name, summary['generation'], frames, format_duration(summary['seconds']),
+        format_duration(summary['seconds'] / frames) if frames else '-')]
+    lines.append("    {0:<12}{1:>9}{2:>8}{3:>10}{4:>10}{5:>10}   per frame 1us..1s".format(
+        'phase', 'total', 'share', 'mean', 'p99', 'max'))
+    for phase, stats in sorted(summary['phases'].items(), key=lambda item: -item[1]['seconds']):
+        lines.append("    {0:<12}{1:>9}{2:>7.1%}{3:>10}{4:>10}{5:>10}   |{6}|".format(
+            phase, format_duration(stats['seconds']), stats['share'], format_duration(stats['mean']),
+            format_duration(stats['p99']), format_duration(stats['max']), sparkline(stats['histogram'])))
+    return '\n'.join(lines)
+
+
+# prints the frame profile of every generation right after StdOutReporter's fitness report
+class ProfileReporter(BaseReporter):
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.generation = None
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def post_evaluate(self, config, population, species, best_genome):
+        print(format_summary(self.profiler.end_generation(self.generation)))
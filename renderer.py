@@ -0,0 +1,73 @@
+import pygame
+
+
+# Dirty rectangle renderer for the game windows. Instead of redrawing the whole background and pushing the whole
+# window to the display every frame, only the areas drawn in this or the last frame are restored and updated.
+# It stands in for the window in the draw code (it has the blit() of a Surface, so pipe.draw(renderer) and
+# sprite_group.draw(renderer) work unchanged) and records the rect of everything drawn:
+#   begin_frame()  puts the background back where something was drawn last frame
+#   blit()/track() draw (or record something drawn straight onto window) during the frame
+#   end_frame()    updates the changed areas, or the whole window when they cover most of it anyway
+# With update_display=False it draws onto an offscreen surface instead and never touches the display, which
+# also works without one (headless runs, the SDL dummy driver).
+class DirtyRenderer:
+    def __init__(self, window, background, full_update_ratio=0.7, update_display=True):
+        self.window = window
+        self.window_rect = window.get_rect()
+        self.update_display = update_display
+        # the background is drawn onto black once, in the pixel format of the window, so restoring an area is
+        # a single blit
+        self.background = pygame.Surface(self.window_rect.size, 0, window)
+        self.background.fill((0, 0, 0))
+        self.background.blit(background, (0, 0))
+        self.full_update_ratio = full_update_ratio
+        self.drawn = []  # rects drawn this frame
+        self.last_drawn = []  # rects drawn last frame, erased at the start of this one
+        self.full_redraw = True
+
+    def invalidate(self):  # redraws the whole window next frame, e.g. after something drew over it directly
+        self.full_redraw = True
+
+    def begin_frame(self):
+        if self.full_redraw:
+            self.window.blit(self.background, (0, 0))
+        else:
+            for rect in self.last_drawn:
+                self.window.blit(self.background, rect, rect)
+        self.drawn = []
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        rect = self.window.blit(source, dest, area, special_flags)
+        self.drawn.append(rect)
+        return rect
+
+    def track(self, rect):
+        self.drawn.append(rect)
+        return rect
+
+    def end_frame(self):
+        if not self.update_display:
+            self.last_drawn = self.drawn
+            self.full_redraw = False
+            return
+
+        # overlapping areas (a pipe before and after it moved, birds flying close together) are merged
+        # so no pixel is sent twice
+        dirty = []
+        for rect in self.last_drawn + self.drawn:
+            rect = rect.clip(self.window_rect)
+            if not rect.w or not rect.h:
+                continue
+            i = rect.collidelist(dirty)
+            while i != -1:
+                rect = rect.union(dirty.pop(i))
+                i = rect.collidelist(dirty)
+            dirty.append(rect)
+
+        dirty_area = sum(rect.w * rect.h for rect in dirty)
+        if self.full_redraw or dirty_area > self.full_update_ratio * self.window_rect.w * self.window_rect.h:
+            pygame.display.update()
+        else:
+            pygame.display.update(dirty)
+        self.last_drawn = self.drawn
+        self.full_redraw = False
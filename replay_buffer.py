@@ -0,0 +1,70 @@
+import numpy as np
+
+ARRAYS = ('states', 'actions', 'rewards', 'next_states', 'dones', 'discounts')  # one row per transition
+
+
+# Experience replay memory of the DQN: the last `capacity` transitions in preallocated NumPy arrays, used as a ring
+# buffer, so adding a transition is a few array writes and a minibatch is one fancy index per array. Every
+# transition also keeps the discount its bootstrapped value gets (gamma ** frames when an action was repeated for
+# several frames, see main.py)
+class ReplayBuffer:
+    def __init__(self, capacity, state_size, seed=None):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32)  # 1.0 when the episode ended with the transition
+        self.discounts = np.zeros(capacity, dtype=np.float32)
+        self.position = 0  # where the next transition goes
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done, discount):
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.discounts[i] = discount
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    # adds a batch of transitions at once, e.g. one step of every game of a FlappyVecEnv
+    def add_batch(self, states, actions, rewards, next_states, dones, discounts):
+        indices = (self.position + np.arange(len(actions))) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+        self.discounts[indices] = discounts
+        self.position = (self.position + len(actions)) % self.capacity
+        self.size = min(self.size + len(actions), self.capacity)
+
+    # copies of the stored transitions and the sampling rng, for checkpoints
+    def state(self):
+        return {'arrays': {name: getattr(self, name)[:self.size].copy() for name in ARRAYS},
+                'position': self.position, 'rng': self.rng.bit_generator.state}
+
+    def load_state(self, state):
+        size = len(state['arrays']['actions'])
+        if size > self.capacity:
+            raise ValueError("the saved replay memory holds {0} transitions, more than the capacity of {1}"
+                             .format(size, self.capacity))
+        for name in ARRAYS:
+            getattr(self, name)[:size] = state['arrays'][name]
+        self.size = size
+        self.position = state['position'] % self.capacity
+        self.rng.bit_generator.state = state['rng']
+
+    # batch_size transitions drawn uniformly (with replacement) as the arrays
+    # (states, actions, rewards, next_states, dones, discounts)
+    def sample(self, batch_size):
+        indices = self.rng.integers(0, self.size, batch_size)
+        return (self.states[indices], self.actions[indices], self.rewards[indices], self.next_states[indices],
+                self.dones[indices], self.discounts[indices])
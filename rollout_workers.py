@@ -0,0 +1,155 @@
+import signal
+import traceback
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from course import generation_seed
+
+
+# the arrays the policy process and the workers share: name, shape of one game's entry and dtype
+def shared_arrays(observation_size):
+    return [('observations', (observation_size,), np.float32),
+            ('rewards', (), np.float32),
+            ('dones', (), np.bool_),
+            ('scores', (), np.int64),  # info['score'] of the env, the score a finished game reached
+            ('actions', (), np.int64)]
+
+
+def array_views(blocks, observation_size, num_envs):
+    return {name: np.ndarray((num_envs,) + shape, dtype, buffer=block.buf)
+            for block, (name, shape, dtype) in zip(blocks, shared_arrays(observation_size))}
+
+
+# Headless games stepped by num_workers worker processes, for collecting experience on every core. Each worker runs
+# make_env(seed), a batched environment with the reset(seeds) / step(actions) API of vec_env.FlappyVecEnv, and all
+# of their games together look like one batched environment of num_workers * envs_per_worker games to the policy.
+# The observations, rewards, dones, scores and actions live in multiprocessing.shared_memory arrays the workers read
+# and write in place, so a step only sends every worker a few bytes to start it and waits for a few bytes back,
+# nothing is pickled. step_async() / step_wait() let the policy do other work while the workers step.
+# make_env is sent to the workers once, so with start methods other than 'fork' it must pickle (a module level
+# function or a functools.partial of one) and the workers import the main script, like multiprocessing.Pool does
+class SharedVecEnv:
+    def __init__(self, make_env, num_workers, envs_per_worker, observation_size, seed=None, start_method=None):
+        self.num_workers = num_workers
+        self.envs_per_worker = envs_per_worker
+        self.num_envs = num_workers * envs_per_worker
+        self.observation_size = observation_size
+        self.blocks = [shared_memory.SharedMemory(create=True, size=max(1, self.num_envs * int(np.prod(shape)) *
+                                                                        np.dtype(dtype).itemsize))
+                       for name, shape, dtype in shared_arrays(observation_size)]
+        self.arrays = array_views(self.blocks, observation_size, self.num_envs)
+        self.waiting = False
+
+        context = multiprocessing.get_context(start_method)
+        self.connections = []
+        self.processes = []
+        for index in range(num_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=worker, daemon=True,
+                                      args=(worker_connection, make_env, generation_seed(seed, index),
+                                            [block.name for block in self.blocks], observation_size, self.num_envs,
+                                            index * envs_per_worker, (index + 1) * envs_per_worker))
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    # starts every game anew, seeds has one course seed per game (None lets the workers draw them)
+    def reset(self, seeds=None):
+        for index, connection in enumerate(self.connections):
+            start = index * self.envs_per_worker
+            connection.send_bytes(b'reset')
+            connection.send(None if seeds is None else list(seeds[start:start + self.envs_per_worker]))
+        self.wait()
+        return self.arrays['observations'].copy()
+
+    def step_async(self, actions):
+        self.arrays['actions'][:] = actions
+        for connection in self.connections:
+            connection.send_bytes(b'step')
+        self.waiting = True
+
+    # the results of the step started by step_async(), like FlappyVecEnv.step
+    def step_wait(self):
+        self.wait()
+        return (self.arrays['observations'].copy(), self.arrays['rewards'].copy(), self.arrays['dones'].copy(),
+                {'score': self.arrays['scores'].copy()})
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def wait(self):
+        errors = []
+        for index, connection in enumerate(self.connections):
+            message = connection.recv_bytes()
+            if message != b'ok':
+                errors.append("rollout worker {0} failed:\n{1}".format(index, message.decode()))
+        self.waiting = False
+        if errors:
+            self.close()
+            raise RuntimeError('\n'.join(errors))
+
+    # stops the workers and frees the shared memory, call it once collecting is done
+    def close(self):
+        if self.processes is None:
+            return
+        if self.waiting:
+            for connection in self.connections:
+                connection.recv_bytes()
+        for connection in self.connections:
+            try:
+                connection.send_bytes(b'close')
+            except OSError:
+                pass  # the worker is gone already
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+        self.arrays = None  # the views must go before the memory they point into
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.processes = None
+
+
+# the loop of a worker process: steps its slice [start, stop) of the shared arrays whenever the policy says so
+def worker(connection, make_env, seed, block_names, observation_size, num_envs, start, stop):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the policy process, which closes the workers
+    blocks = [shared_memory.SharedMemory(name=name) for name in block_names]
+    arrays = {name: array[start:stop] for name, array in array_views(blocks, observation_size, num_envs).items()}
+    env = error = None
+    try:
+        env = make_env(seed)
+    except Exception:
+        error = traceback.format_exc()  # reported as the answer to every command
+    try:
+        while True:
+            command = connection.recv_bytes()
+            if command == b'close':
+                break
+            if command == b'reset':
+                seeds = connection.recv()
+            if error is not None:
+                connection.send_bytes(error.encode())
+                continue
+            try:
+                if command == b'step':
+                    observations, rewards, dones, info = env.step(arrays['actions'])
+                    arrays['rewards'][:] = rewards
+                    arrays['dones'][:] = dones
+                    arrays['scores'][:] = info.get('score', 0)
+                else:
+                    observations = env.reset(seeds)
+                arrays['observations'][:] = observations
+                connection.send_bytes(b'ok')
+            except Exception:
+                connection.send_bytes(traceback.format_exc().encode())
+    except (EOFError, OSError):
+        pass  # the policy process went away
+    finally:
+        arrays = None
+        for block in blocks:
+            block.close()
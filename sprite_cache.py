@@ -0,0 +1,27 @@
+import pygame
+from collections import namedtuple
+
+# An animation frame rotated by some angle: the surface pygame.transform.rotate gives and the offset of its top left
+# corner from the top left of the unrotated frame when both share the same centre. Collision masks are not kept
+# here, collision.get_mask is the one mask cache
+RotatedSprite = namedtuple('RotatedSprite', ['surface', 'offset'])
+
+# the birds only ever take a handful of angles (tilt moves in ROTATION_VEL steps, the flappy velocity in 0.5 steps),
+# so every (frame, angle) pair is rotated once, the first time it is drawn, and reused after that
+_rotations = {}
+
+
+def get_rotated(image, angle):
+    key = (image, angle)
+    rotated = _rotations.get(key)
+    if rotated is None:
+        surface = pygame.transform.rotate(image, angle)
+        offset = (image.get_width() // 2 - surface.get_width() // 2,
+                  image.get_height() // 2 - surface.get_height() // 2)
+        rotated = _rotations[key] = RotatedSprite(surface, offset)
+    return rotated
+
+
+def blit_rotated(win, image, angle, topleft):  # draws image rotated around its centre, as if it stood at topleft
+    rotated = get_rotated(image, angle)
+    win.blit(rotated.surface, image.get_rect(topleft=topleft).move(rotated.offset))
@@ -0,0 +1,120 @@
+import struct
+import numpy as np
+
+# Binary trajectory log of NEAT training runs. The file starts with MAGIC and is followed by one block per
+# generation: a GENERATION_HEADER (b'G', generation, course seed, population size, byte length of the rest of the
+# block) and then frame blocks, each b'F', record count and that many RECORD entries. The byte length lets a reader
+# seek from generation to generation and only read the one it wants; a generation the recorder never finished (the
+# run died) keeps UNFINISHED and runs to the end of the file.
+# Only birds that are alive in a frame are written, each as one fixed width record.
+MAGIC = b'FTRJ\x02'
+GENERATION_HEADER = struct.Struct('<cIIIQ')
+FRAMES_HEADER = struct.Struct('<cI')
+RECORD = np.dtype([('frame', '<u4'), ('bird', '<u2'), ('y', '<f4'), ('tilt', 'i1'), ('action', 'u1')])
+MAX_POPULATION = np.iinfo(RECORD['bird']).max + 1  # bird indices have to fit into the record
+UNFINISHED = 2 ** 64 - 1
+
+
+# Streams the bird states of every frame into a preallocated record buffer which is written out in bulk
+class TrajectoryRecorder:
+    def __init__(self, path, buffer_size=65536):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.buffer = np.zeros(buffer_size, dtype=RECORD)
+        self.count = 0
+        self.header = None  # file position of the header of the current generation
+
+    def start_generation(self, generation, seed, population_size):
+        if population_size > MAX_POPULATION:
+            raise ValueError("trajectory logs hold at most {0} birds per generation, not {1}"
+                             .format(MAX_POPULATION, population_size))
+        self.end_generation()
+        self.header = self.file.tell()
+        self.file.write(GENERATION_HEADER.pack(b'G', generation, seed, population_size, UNFINISHED))
+
+    # writes out the current generation and puts its byte length into its header
+    def end_generation(self):
+        self.flush()
+        if self.header is None:
+            return
+        end = self.file.tell()
+        self.file.seek(self.header + GENERATION_HEADER.size - 8)
+        self.file.write(struct.pack('<Q', end - self.header - GENERATION_HEADER.size))
+        self.file.seek(end)
+        self.header = None
+
+    def record_frame(self, frame, population, actions):  # every alive bird of a BirdPopulation and whether it jumped
+        birds = np.flatnonzero(population.alive)
+        if self.count + len(birds) > len(self.buffer):
+            self.flush()
+        if len(birds) > len(self.buffer):
+            self.buffer = np.zeros(len(birds), dtype=RECORD)
+
+        records = self.buffer[self.count:self.count + len(birds)]
+        records['frame'] = frame
+        records['bird'] = birds
+        records['y'] = population.y[birds]
+        records['tilt'] = population.tilt[birds]
+        records['action'] = actions[birds]
+        self.count += len(birds)
+
+    def flush(self):
+        if self.count:
+            self.file.write(FRAMES_HEADER.pack(b'F', self.count))
+            self.file.write(self.buffer[:self.count].tobytes())
+            self.count = 0
+
+    def close(self):
+        self.end_generation()
+        self.file.close()
+
+
+# Yields (generation, seed, population_size, length) for every generation in an open trajectory log, with the file
+# positioned at the frame blocks of that generation. Skipping a generation is one seek, nothing of it is read
+def generation_headers(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("{0} is not a trajectory log".format(path))
+    while True:
+        position = f.tell()
+        header = f.read(GENERATION_HEADER.size)
+        if not header:
+            return
+        if len(header) < GENERATION_HEADER.size or header[:1] != b'G':
+            raise ValueError("corrupt trajectory log {0} at byte {1}".format(path, position))
+        generation, seed, population_size, length = GENERATION_HEADER.unpack(header)[1:]
+        yield generation, seed, population_size, length
+        if length == UNFINISHED:
+            return
+        f.seek(position + GENERATION_HEADER.size + length)
+
+
+# the records of the generation whose frame blocks start at the current position of f
+def read_records(f, path, length):
+    data = f.read() if length == UNFINISHED else f.read(length)
+    chunks = []
+    position = 0
+    while position < len(data):
+        if data[position:position + 1] != b'F':
+            raise ValueError("corrupt trajectory log {0} in the generation at byte {1}".format(path, f.tell()))
+        count = FRAMES_HEADER.unpack_from(data, position)[1]
+        position += FRAMES_HEADER.size
+        chunks.append(np.frombuffer(data, dtype=RECORD, count=count, offset=position))
+        position += count * RECORD.itemsize
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=RECORD)
+
+
+# (seed, population_size, records) of one generation of a trajectory log, only its own block is read
+def read_generation(path, generation):
+    with open(path, 'rb') as f:
+        for recorded_generation, seed, population_size, length in generation_headers(f, path):
+            if recorded_generation == generation:
+                return seed, population_size, read_records(f, path, length)
+    raise ValueError("generation {0} is not in {1}".format(generation, path))
+
+
+# Splits the records of one generation into one array per frame
+def split_frames(records):
+    if len(records) == 0:
+        return []
+    boundaries = np.flatnonzero(np.diff(records['frame'])) + 1
+    return np.split(records, boundaries)
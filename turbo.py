@@ -0,0 +1,56 @@
+import pygame
+from game_loop import GameLoop
+
+# Speed control for watching the NEAT training. It is the GameLoop of the windowed training runs, the speed only
+# changes how fast the steps come and which of them are drawn, so the simulation itself never waits on a clock:
+#   1x      every step is drawn and the loop runs at the game's fps
+#   10x     the loop runs at ten times the fps and at most render_fps steps a second are drawn
+#   max     the loop runs uncapped and at most render_fps steps a second are drawn
+#   paused  the loop runs uncapped and nothing is drawn until another speed is picked
+# The speed is switched while training with the keys 1, 2, 3 and 0 (or P)
+SPEEDS = {'1x': 1, '10x': 10, 'max': None, 'paused': None}
+SPEED_KEYS = {pygame.K_1: '1x', pygame.K_2: '10x', pygame.K_3: 'max', pygame.K_0: 'paused', pygame.K_p: 'paused'}
+RENDER_FPS = 60  # pygame has no portable way to ask the display refresh rate, so it is assumed to be 60 Hz
+
+
+class TurboControl(GameLoop):
+    def __init__(self, fps, speed='1x', render_every=1, render_fps=RENDER_FPS, draw_top=None, caption=None):
+        if speed not in SPEEDS:
+            raise ValueError("unknown speed {0!r}, expected one of {1}".format(speed, ', '.join(SPEEDS)))
+        self.game_fps = fps  # steps a second of the game at 1x
+        self.max_render_fps = render_fps
+        self.draw_top = draw_top  # only draw the best this many birds, all alive birds when None
+        self.caption = caption
+        self.speed = speed
+        GameLoop.__init__(self, fps, render_every=render_every)
+        self.set_speed(speed)
+
+    # called when a generation starts, its frame numbers start again from 0
+    def reset(self):
+        GameLoop.reset(self)
+        if self.caption is not None and pygame.display.get_surface() is not None:
+            pygame.display.set_caption("{0} [{1}]".format(self.caption, self.speed))
+
+    def set_speed(self, speed):
+        self.speed = speed
+        multiplier = SPEEDS[speed]
+        self.set_fps(self.game_fps * multiplier if multiplier else None)
+        self.render_fps = None if speed == '1x' else self.max_render_fps
+        self.reset()
+
+    # GameLoop.tick that also switches the speed on the speed keys, returns the events like it
+    def tick(self, profiler=None):
+        events = GameLoop.tick(self, profiler)
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key in SPEED_KEYS:
+                self.set_speed(SPEED_KEYS[event.key])
+        if self.speed == 'paused':
+            self.render = False
+        return events
+
+    # indices of the birds to draw: all alive birds, or the draw_top alive ones with the highest fitness
+    def visible(self, alive, fitness):
+        indices = [i for i, is_alive in enumerate(alive) if is_alive]
+        if self.draw_top is None:
+            return indices
+        return sorted(indices, key=lambda i: -fitness[i])[:self.draw_top]
@@ -0,0 +1,154 @@
+import random
+import numpy as np
+import assets
+from course import Course
+from sprite_cache import get_rotated
+
+# Same window, bird and ground layout as flappy.py. flappy.py opens its window when it is imported, so the numbers
+# are repeated here instead of imported
+WIN_WIDTH = 551
+WIN_HEIGHT = 720
+BIRD_START = (100, 250)
+GROUND_Y = 520
+MAX_PIPES = 8  # pipe pairs a game keeps at most, a pair lives ~370 frames and a new one comes every 90+ frames
+
+
+# N independent flappy.py games simulated together as NumPy arrays, for agents that want to step the game in batch
+# (gym style vector environment):
+#   obs = env.reset(seeds)                      seeds fix the pipe courses, like Course(seed) in flappy.py
+#   obs, rewards, dones, info = env.step(actions)
+# Every step is one frame of flappy.main with the same Bird.update gravity (vel += 0.5, at most 7), the same pipe
+# spawning (course.pipe_pair(), pipe_timer) and the same rect collisions. An action of 1 flaps, like holding SPACE.
+# The observation of a game is preprocess_state() of main.py: bird y, distance to the next pipe and the top and
+# bottom of that pipe, scaled by the window size. The reward is 1 for every frame the bird survives and -1 for
+# the frame it crashes in (into a pipe or the ground, after a pipe flappy.py lets the bird fall down without control,
+# which the environment skips). A crashed game ends (done) and is started again on the next course right away, the
+# observation returned for it is already the one of the new game and info['score'] holds the score it reached.
+# scroll_speed, gap_range and timer_step default to flappy.py, main.py plays with 1, (90, 130) and 1.
+class FlappyVecEnv:
+    def __init__(self, num_envs, seed=None, scroll_speed=3, gap_range=(110, 130), timer_step=2):
+        self.num_envs = num_envs
+        self.scroll_speed = scroll_speed
+        self.gap_range = gap_range
+        self.timer_step = timer_step
+        self.seeds = random.Random(seed)  # course seeds of the games started after a crash
+
+        self.bird_w, self.bird_h = assets.size(assets.BIRD_FRAMES[0])  # the rect keeps the size of the first frame
+        self.bird_x = BIRD_START[0] - self.bird_w // 2
+        self.bird_start_y = BIRD_START[1] - self.bird_h // 2
+        self.pipe_w, self.top_pipe_h = assets.size('pipe_top')
+        self.bottom_pipe_h = assets.size('pipe_bottom')[1]
+
+        n = num_envs
+        self.y = np.zeros(n, dtype=np.int64)
+        self.vel = np.zeros(n)
+        self.flap = np.zeros(n, dtype=bool)
+        self.image_index = np.zeros(n, dtype=np.int64)
+        self.pipe_timer = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.frame = np.zeros(n, dtype=np.int64)
+        self.pipe_x = np.zeros((n, MAX_PIPES), dtype=np.int64)
+        self.pipe_top = np.zeros((n, MAX_PIPES), dtype=np.int64)  # y of the top pipe rect
+        self.pipe_bottom = np.zeros((n, MAX_PIPES), dtype=np.int64)  # y of the bottom pipe rect
+        self.pipe_active = np.zeros((n, MAX_PIPES), dtype=bool)
+        self.pipe_passed = np.zeros((n, MAX_PIPES), dtype=bool)
+        self.pipes_spawned = np.zeros(n, dtype=np.int64)
+        self.courses = [None] * n
+
+    def reset(self, seeds=None):  # starts every game anew, seeds has one course seed per game (None draws them)
+        if seeds is None:
+            seeds = [None] * self.num_envs
+        if len(seeds) != self.num_envs:
+            raise ValueError("expected {0} seeds, got {1}".format(self.num_envs, len(seeds)))
+        self.reset_games(np.arange(self.num_envs), seeds)
+        return self.observe()
+
+    def reset_games(self, games, seeds=None):
+        for i, game in enumerate(games):
+            seed = seeds[i] if seeds is not None and seeds[i] is not None else self.seeds.randrange(2 ** 32)
+            self.courses[game] = Course(seed)
+        self.y[games] = self.bird_start_y
+        self.vel[games] = 0
+        self.flap[games] = False
+        self.image_index[games] = 0
+        self.pipe_timer[games] = 0
+        self.score[games] = 0
+        self.frame[games] = 0
+        self.pipe_active[games] = False
+        self.pipe_passed[games] = False
+        self.pipes_spawned[games] = 0
+
+    def step(self, actions):
+        actions = np.asarray(actions, dtype=bool)
+
+        # Pipes, like Pipe.update: move, drop the ones far off screen, score the bottom pipes the bird got past
+        self.pipe_x[self.pipe_active] -= self.scroll_speed
+        self.pipe_active &= self.pipe_x > -WIN_WIDTH
+        passed = self.pipe_active & ~self.pipe_passed & (BIRD_START[0] > self.pipe_x + self.pipe_w)
+        self.pipe_passed |= passed
+        self.score += passed.sum(axis=1)
+
+        # Bird, like Bird.update: gravity, then flapping unless the last flap is still going on
+        self.image_index = (self.image_index + 1) % 30
+        self.vel = np.minimum(self.vel + 0.5, 7)
+        falling = self.y < 500
+        self.y[falling] += np.trunc(self.vel[falling]).astype(np.int64)
+        self.flap[self.vel == 0] = False
+        flapping = actions & ~self.flap & (self.y > 0)
+        self.flap |= flapping
+        self.vel[flapping] = -7
+
+        # Collisions of the bird rect with the pipe rects and the ground, like pygame.sprite.spritecollide
+        bird_top = self.y[:, None]
+        bird_bottom = bird_top + self.bird_h
+        in_column = (self.bird_x < self.pipe_x + self.pipe_w) & (self.bird_x + self.bird_w > self.pipe_x)
+        hit_top = (bird_top < self.pipe_top + self.top_pipe_h) & (bird_bottom > self.pipe_top)
+        hit_bottom = (bird_top < self.pipe_bottom + self.bottom_pipe_h) & (bird_bottom > self.pipe_bottom)
+        crashed = (self.pipe_active & in_column & (hit_top | hit_bottom)).any(axis=1) | (self.y + self.bird_h > GROUND_Y)
+
+        # Spawn Pipes
+        for game in np.flatnonzero((self.pipe_timer <= 0) & ~crashed):
+            y_top, gap, self.pipe_timer[game] = self.courses[game].pipe_pair(self.gap_range)
+            slot = self.pipes_spawned[game] % MAX_PIPES
+            self.pipe_x[game, slot] = 550
+            self.pipe_top[game, slot] = y_top
+            self.pipe_bottom[game, slot] = y_top + gap + self.bottom_pipe_h
+            self.pipe_active[game, slot] = True
+            self.pipe_passed[game, slot] = False
+            self.pipes_spawned[game] += 1
+        self.pipe_timer -= self.timer_step
+        self.frame += 1
+
+        rewards = np.where(crashed, -1.0, 1.0)
+        info = {'score': self.score.copy(), 'frames': self.frame.copy()}
+        games = np.flatnonzero(crashed)
+        if len(games):
+            self.reset_games(games)
+        return self.observe(), rewards, crashed, info
+
+    # preprocess_state() of main.py for every game: the next pipe is the first one (in spawn order) right of the bird
+    def observe(self):
+        ahead = self.pipe_active & (self.pipe_x > self.bird_x)
+        next_pipe = np.where(ahead, self.pipe_x, np.iinfo(np.int64).max).argmin(axis=1)
+        rows = np.arange(self.num_envs)
+        has_pipe = ahead.any(axis=1)
+        obs = np.ones((self.num_envs, 4))
+        obs[:, 0] = self.y / WIN_HEIGHT
+        obs[has_pipe, 1] = (self.pipe_x[rows, next_pipe] - self.bird_x)[has_pipe] / WIN_WIDTH
+        obs[has_pipe, 2] = self.pipe_top[rows, next_pipe][has_pipe] / WIN_HEIGHT
+        obs[has_pipe, 3] = (self.pipe_top[rows, next_pipe] + self.top_pipe_h)[has_pipe] / WIN_HEIGHT
+        return obs
+
+    # draws one of the games onto surface the way flappy.py shows it, the games themselves never draw anything
+    def render(self, surface, game=0):
+        surface.fill((0, 0, 0))
+        surface.blit(assets.image('background'), (0, 0))
+        for slot in np.flatnonzero(self.pipe_active[game]):
+            surface.blit(assets.image('pipe_top'), (self.pipe_x[game, slot], self.pipe_top[game, slot]))
+            surface.blit(assets.image('pipe_bottom'), (self.pipe_x[game, slot], self.pipe_bottom[game, slot]))
+        ground = assets.image('ground')
+        ground_x = -(self.frame[game] * self.scroll_speed) % WIN_WIDTH
+        surface.blit(ground, (ground_x - WIN_WIDTH, GROUND_Y))
+        surface.blit(ground, (ground_x, GROUND_Y))
+        image = assets.image(assets.BIRD_FRAMES[self.image_index[game] // 10])
+        surface.blit(get_rotated(image, self.vel[game] * -7).surface, (self.bird_x, self.y[game]))
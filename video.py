@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import queue
+import warnings
+import threading
+import pygame
+
+# Writes recorded runs to disk as raw video streams on a background thread. Every clip is a NAME.raw file with the
+# frames one after the other, row by row, in the 32 bit pixel format of the surface they were captured from, next
+# to a NAME.json with its size, fps, frame count and pixel format, so it can be turned into a video with e.g.
+#   ffmpeg -f rawvideo -pix_fmt bgr0 -s 500x800 -r 30 -i NAME.raw NAME.mp4
+# The game loop only copies the pixels of a frame (capture(), a plain memory copy) and hands them over, writing
+# them happens on the writer thread. At most max_queued frames wait for the writer. Frames arriving while it is that
+# far behind either wait for it (write(block=True), for clips rendered after the fact, which have no frame rate to
+# keep up) or are dropped instead of making the game wait for the disk; drops are counted in the json and warned
+# about when the clip ends.
+MAX_QUEUED = 64
+
+
+# the pixels of a 32 bit surface as a (height, width) array of uint32, surfarray indexes them by x first
+def capture(surface):
+    return pygame.surfarray.pixels2d(surface).T.copy()
+
+
+# ffmpeg name of the byte order of a 32 bit surface, e.g. bgr0 for pygame's default surfaces on little endian cpus
+def pixel_format(surface):
+    names = ['0'] * 4
+    for name, shift, mask in zip('rgba', surface.get_shifts(), surface.get_masks()):
+        if mask:
+            names[shift // 8] = name
+    if sys.byteorder == 'big':
+        names.reverse()
+    return ''.join(names)
+
+
+class VideoWriter:
+    def __init__(self, directory, max_queued=MAX_QUEUED):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_queued = max_queued
+        self.queue = queue.Queue()
+        self.free = threading.Semaphore(max_queued)  # a frame takes one to be queued, the writer gives it back
+        self.clip = None  # metadata of the clip being written
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    # starts a clip of frames captured from surface, the extra metadata goes into its json
+    def start_clip(self, name, surface, fps, **metadata):
+        if self.clip is not None:
+            self.end_clip()
+        if surface.get_bitsize() != 32:
+            raise ValueError("clips can only be captured from 32 bit surfaces")
+        width, height = surface.get_size()
+        self.clip = dict(metadata, name=name, width=width, height=height, fps=fps, pix_fmt=pixel_format(surface),
+                         frames=0, dropped=0)
+        self.queue.put(('start', name))
+
+    # queues the pixels of one frame (from capture()), returns False when the frame was dropped. With block the
+    # frame waits until the writer has room for it instead and is never dropped
+    def write(self, pixels, block=False):
+        if not self.free.acquire(blocking=block):
+            self.clip['dropped'] += 1
+            return False
+        self.clip['frames'] += 1
+        self.queue.put(('frame', pixels))
+        return True
+
+    def end_clip(self):
+        if self.clip['dropped']:
+            warnings.warn("clip {0} dropped {1} of {2} frames, the disk could not keep up".format(
+                self.clip['name'], self.clip['dropped'], self.clip['frames'] + self.clip['dropped']))
+        self.queue.put(('end', self.clip))
+        self.clip = None
+
+    # waits until every queued frame is on disk and stops the writer thread
+    def close(self):
+        if self.clip is not None:
+            self.end_clip()
+        self.queue.put(('stop', None))
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        file = None
+        while True:
+            kind, item = self.queue.get()
+            if kind == 'stop':
+                break
+            if kind == 'frame':
+                self.free.release()  # the pixels are out of the queue, written or not
+            if self.error is not None:
+                continue  # the writer failed, the rest is drained so the game never notices until close()
+            try:
+                if kind == 'start':
+                    file = open(os.path.join(self.directory, item + '.raw'), 'wb')
+                elif kind == 'frame':
+                    file.write(item)
+                elif kind == 'end':
+                    file.close()
+                    with open(os.path.join(self.directory, item['name'] + '.json'), 'w') as f:
+                        json.dump(item, f, indent=2)
+            except Exception as e:
+                self.error = e
+        if file is not None and not file.closed:
+            file.close()